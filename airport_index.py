@@ -0,0 +1,117 @@
+import csv
+import os
+import logging
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airports.csv")
+
+
+@dataclass(frozen=True)
+class Airport:
+    iata: str
+    city: str
+    country_code: str
+    country: str
+    rank: int # Posición por tráfico dentro del país (1 = principal)
+
+    @property
+    def label(self) -> str:
+        """Formato usado por los selectores de la GUI: 'Ciudad (IATA)'."""
+        return f"{self.city} ({self.iata})"
+
+
+class AirportIndex:
+    """
+    Índice offline de aeropuertos (IATA, ciudad, país, ranking de tráfico).
+    Se carga una vez desde `airports.csv` y resuelve consultas en memoria, sin red.
+    """
+
+    def __init__(self, airports: List[Airport]):
+        self._by_iata: Dict[str, Airport] = {a.iata: a for a in airports}
+
+        self._by_country: Dict[str, List[Airport]] = {}
+        for airport in airports:
+            self._by_country.setdefault(airport.country_code, []).append(airport)
+        for country_airports in self._by_country.values():
+            country_airports.sort(key=lambda a: a.rank)
+
+        # Llaves de búsqueda por prefijo (IATA, ciudad y país), ordenadas para bisect
+        keys = set()
+        for airport in airports:
+            for text in (airport.iata, airport.city, airport.country):
+                keys.add((text.lower(), airport.rank, airport.iata))
+        self._search_keys = sorted(keys)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_DATA_PATH) -> "AirportIndex":
+        airports = []
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    airports.append(Airport(
+                        iata=row["iata"].strip().upper(),
+                        city=row["city"].strip(),
+                        country_code=row["country_code"].strip().upper(),
+                        country=row["country"].strip(),
+                        rank=int(row["rank"])
+                    ))
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Error cargando índice de aeropuertos ({path}): {e}")
+        return cls(airports)
+
+    def __len__(self) -> int:
+        return len(self._by_iata)
+
+    def get(self, iata: str) -> Optional[Airport]:
+        return self._by_iata.get(iata.upper())
+
+    def has_country(self, country_code: str) -> bool:
+        return country_code.upper() in self._by_country
+
+    def top_airports(self, country_code: str, limit: int) -> List[str]:
+        """
+        Códigos IATA principales de un país ordenados por tráfico.
+        """
+        return [a.iata for a in self._by_country.get(country_code.upper(), [])[:limit]]
+
+    def search(self, prefix: str, limit: int = 50) -> List[Airport]:
+        """
+        Busca aeropuertos cuyo IATA, ciudad o país empiece por `prefix` (sin distinguir mayúsculas).
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        pos = bisect_left(self._search_keys, (prefix,))
+        while pos < len(self._search_keys) and len(results) < limit:
+            text, _, iata = self._search_keys[pos]
+            if not text.startswith(prefix):
+                break
+            if iata not in seen:
+                seen.add(iata)
+                results.append(self._by_iata[iata])
+            pos += 1
+        return results
+
+    def gui_locations(self) -> Dict[str, List[str]]:
+        """
+        Mapa País -> ['Whole Country (XX)', 'Ciudad (IATA)', ...] para los selectores de la GUI.
+        """
+        locations = {}
+        countries = sorted(self._by_country.items(), key=lambda item: item[1][0].country)
+        for country_code, airports in countries:
+            locations[airports[0].country] = [f"Whole Country ({country_code})"] + [a.label for a in airports]
+        return locations
+
+
+@lru_cache(maxsize=1)
+def get_default_index() -> AirportIndex:
+    """Índice compartido por el cliente y la GUI (se carga una sola vez por proceso)."""
+    return AirportIndex.load()
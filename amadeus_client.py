@@ -1,12 +1,36 @@
 import requests
+import hashlib
+import json
 import logging
+import os
 import time
 import random
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from datetime import datetime, timedelta
 
+from airport_index import get_default_index
+import instrumentation
+from http_transport import get_shared_session
+from json_stream import iter_json_array
+from normalization import NormalizationPool
+from offers import FlightOffer
+from planner import DateSweepPlanner, AdaptiveQueryPlanner
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
 logger = logging.getLogger(__name__)
 
+
+def default_token_cache_path() -> str:
+    """
+    Ruta por defecto del token OAuth en cache: directorio de cache del usuario
+    ($XDG_CACHE_HOME o ~/.cache), nunca el directorio de trabajo.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "flight_monitor", "amadeus_token.json")
+
 class AmadeusClient:
     """
     Cliente para interactuar con la API de Amadeus (Self-Service).
@@ -23,47 +47,178 @@ class AmadeusClient:
     # Dejaré el base url como variable de clase fácil de cambiar.
     HOST = "https://test.api.amadeus.com" 
 
-    def __init__(self, client_id: str, client_secret: str, config: Dict[str, Any]):
+    # Segundos antes de la expiración en que se renueva el token en segundo plano
+    TOKEN_REFRESH_AHEAD = 120
+
+    def __init__(self, client_id: str, client_secret: str, config: Dict[str, Any],
+                 rate_limiter: Optional[RateLimiter] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 store=None,
+                 session: Optional[requests.Session] = None):
         self.client_id = client_id
         self.client_secret = client_secret
         self.config = config
         self.token = None
         self.token_expiry = 0
-        self.session = requests.Session()
+        # Single-flight: sólo un hilo pide token a la vez; los demás esperan y reutilizan el resultado
+        self._token_lock = threading.Lock()
+        self._token_refreshing = False
+        # Cache del token en disco para que procesos cortos no paguen un login por ejecución
+        token_cache_path = config["system"].get("token_cache_path", default_token_cache_path())
+        self.token_cache_path = os.path.expanduser(token_cache_path) if token_cache_path else None
+        # Pool keep-alive compartido con el resto del proceso (timeouts, gzip, reintentos GET)
+        self.session = session or get_shared_session(config["system"])
+        # Presupuesto global de peticiones compartido entre hilos y endpoints
+        self.rate_limiter = rate_limiter or RateLimiter.from_config(config["system"])
+        # Cache persistente de respuestas (None si está deshabilitado)
+        self.response_cache = response_cache or ResponseCache.from_config(config["system"])
+        # DealStore opcional: persiste el estado de los planificadores entre ejecuciones
+        self.store = store
 
     def _get_token(self):
         """
         Obtiene o renueva el Access Token de OAuth 2.0.
+        Con token vigente no toma el lock. Cerca de la expiración dispara una renovación en
+        segundo plano y sigue usando el token actual; si ya expiró, un solo hilo lo renueva.
         """
         if self.token and time.time() < self.token_expiry:
+            if time.time() >= self.token_expiry - self.TOKEN_REFRESH_AHEAD:
+                self._refresh_token_async()
             return self.token
 
+        with self._token_lock:
+            # Otro hilo pudo renovarlo mientras esperábamos el lock
+            if self.token and time.time() < self.token_expiry:
+                return self.token
+            if self._load_cached_token():
+                return self.token
+            return self._fetch_token()
+
+    def _refresh_token_async(self):
+        # Si el lock está tomado alguien ya está renovando: no bloquear al llamador
+        if not self._token_lock.acquire(blocking=False):
+            return
+        try:
+            if self._token_refreshing:
+                return
+            self._token_refreshing = True
+        finally:
+            self._token_lock.release()
+
+        def _refresh():
+            try:
+                with self._token_lock:
+                    if time.time() < self.token_expiry - self.TOKEN_REFRESH_AHEAD:
+                        return
+                    self._fetch_token()
+            except requests.RequestException:
+                # El token actual sigue vigente; se reintenta en la siguiente llamada
+                pass
+            finally:
+                self._token_refreshing = False
+
+        threading.Thread(target=_refresh, name="amadeus-token-refresh", daemon=True).start()
+
+    def _fetch_token(self):
+        """
+        Pide un token nuevo. Debe llamarse con `_token_lock` tomado.
+        """
         url = f"{self.HOST}/v1/security/oauth2/token"
         try:
-            response = requests.post(url, data={
-                'grant_type': 'client_credentials',
-                'client_id': self.client_id,
-                'client_secret': self.client_secret
-            })
-            response.raise_for_status()
-            data = response.json()
+            with instrumentation.stage("token"):
+                self.rate_limiter.acquire()
+                response = self.session.post(url, data={
+                    'grant_type': 'client_credentials',
+                    'client_id': self.client_id,
+                    'client_secret': self.client_secret
+                })
+                response.raise_for_status()
+                data = response.json()
             self.token = data['access_token']
             # Renovar 10s antes de que expire por seguridad
             self.token_expiry = time.time() + data['expires_in'] - 10
             logger.info("Token de Amadeus obtenido exitosamente.")
+            self._save_cached_token()
             return self.token
         except requests.RequestException as e:
             logger.error(f"Error autenticando con Amadeus: {e}")
             raise
 
+    def _token_cache_key(self) -> str:
+        # El token sólo vale para el mismo host y las mismas credenciales
+        raw = f"{self.HOST}|{self.client_id}|{self.client_secret}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load_cached_token(self) -> bool:
+        if not self.token_cache_path:
+            return False
+        try:
+            with open(self.token_cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if cached.get("key") != self._token_cache_key() or time.time() >= cached.get("expires_at", 0):
+            return False
+        self.token = cached["access_token"]
+        self.token_expiry = cached["expires_at"]
+        logger.info("Token de Amadeus reutilizado desde cache local.")
+        return True
+
+    def _save_cached_token(self):
+        if not self.token_cache_path:
+            return
+        tmp_path = f"{self.token_cache_path}.tmp"
+        try:
+            cache_dir = os.path.dirname(self.token_cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            # Archivo sólo legible por el usuario; escritura atómica con os.replace.
+            # Un .tmp sobrante conservaría sus permisos con O_TRUNC: se borra antes
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": self._token_cache_key(), "access_token": self.token,
+                           "expires_at": self.token_expiry}, f)
+            os.replace(tmp_path, self.token_cache_path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el token en cache ({self.token_cache_path}): {e}")
+
     def get_headers(self):
         return {
             "Authorization": f"Bearer {self._get_token()}"
         }
 
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Ejecuta una petición autenticada pasando por el rate limiter.
+        Un 429 reintenta la misma petición (Retry-After o backoff con jitter) en lugar de descartarla.
+        """
+        max_retries = self.rate_limiter.max_retries
+        for attempt in range(max_retries + 1):
+            self.rate_limiter.acquire()
+            response = self.session.request(method, url, headers=self.get_headers(), **kwargs)
+            if response.status_code != 429:
+                self.rate_limiter.on_success()
+                return response
+
+            delay = self.rate_limiter.on_throttle(response.headers.get("Retry-After"), attempt)
+            if attempt < max_retries:
+                # Con stream=True la conexión sólo vuelve al pool al cerrar la respuesta
+                response.close()
+                logger.warning(f"Amadeus Rate Limit (429). Reintento {attempt + 1}/{max_retries} en {delay:.1f}s")
+
+        logger.error(f"Amadeus Rate Limit (429): reintentos agotados para {url}")
+        return response
+
     def get_top_airports(self, country_code: str, limit: int) -> List[Dict]:
         """
-        Obtiene aeropuertos principales de un país usando Reference Data API.
+        Obtiene aeropuertos principales de un país.
+        Primero consulta el índice offline (airports.csv); si no lo conoce usa la
+        Reference Data API con cache persistente.
         """
         if self.config["system"].get("use_mock_api", False):
             logger.info("Retornando aeropuertos MOCK...")
@@ -72,6 +227,17 @@ class AmadeusClient:
             if country_code == "FR": return ["CDG", "ORY", "NCE"][:limit]
             if country_code == "US": return ["JFK", "LAX", "ORD", "MIA"][:limit]
             return ["MOCK1", "MOCK2"][:limit]
+        # 1. Índice local: resuelve países y códigos IATA conocidos sin red
+        code = country_code.strip().upper()
+        index = get_default_index()
+        if index.has_country(code):
+            airports = index.top_airports(code, limit)
+            logger.info(f"Aeropuertos (índice local) para {code}: {airports}")
+            return airports
+        if len(code) == 3 and index.get(code):
+            logger.info(f"Usando '{code}' directamente como destino.")
+            return [code]
+
         endpoint = f"{self.HOST}/v1/reference-data/locations"
         # Amadeus requiere keyword. Buscar 'airports in country' no es directo en location/query,
         # pero podemos usar type=AIRPORT y keyword=country_code, aunque a veces es impreciso.
@@ -83,13 +249,24 @@ class AmadeusClient:
             "view": "LIGHT",
             "page[limit]": limit
         }
+
+        # 2. Cache persistente de consultas previas (TTL largo: los aeropuertos casi no cambian)
+        cache_key = None
+        data = None
+        if self.response_cache:
+            cache_key = ResponseCache.make_key("locations", params)
+            data = self.response_cache.get(cache_key)
         
         try:
-            response = self.session.get(endpoint, headers=self.get_headers(), params=params)
-            # Retry logic for sort removed as we removed sort param due to permissions
-                
-            response.raise_for_status()
-            data = response.json().get('data', [])
+            if data is None:
+                response = self._request("GET", endpoint, params=params)
+                # Retry logic for sort removed as we removed sort param due to permissions
+                    
+                response.raise_for_status()
+                data = response.json().get('data', [])
+                if cache_key:
+                    ttl_days = self.config["system"].get("airport_cache_ttl_days", 30)
+                    self.response_cache.set(cache_key, data, ttl_seconds=int(ttl_days * 86400))
             
             airports = [loc['iataCode'] for loc in data if 'iataCode' in loc]
             
@@ -108,7 +285,7 @@ class AmadeusClient:
                 return [country_code]
             return []
 
-    def _generate_mock_deals(self, origin: str, dest_airports: List[str]) -> List[Dict[str, Any]]:
+    def _generate_mock_deals(self, origin: str, dest_airports: List[str]) -> List[FlightOffer]:
         """Genera ofertas falsas para pruebas sin API key."""
         logger.info("Generando ofertas MOCK...")
         deals = []
@@ -116,17 +293,17 @@ class AmadeusClient:
         config_budget = self.config["budget"]
         
         # Oferta Garantizada "Barata" para probar notificaciones
-        cheap_deal = {
-            "price": 5000.0,
-            "cityCodeFrom": origin,
-            "cityCodeTo": dest_airports[0] if dest_airports else "MOCK",
-            "dTime": int((today + timedelta(days=45)).timestamp()),
-            "aTime": int((today + timedelta(days=55)).timestamp()),
-            "route": ["DIRECT_FLIGHT"],
-            "airlines": ["MOCK_AIR"],
-            "deep_link": "https://mock-airline.com/deal",
-            "source": "mock"
-        }
+        cheap_deal = FlightOffer(
+            price=5000.0,
+            city_from=origin,
+            city_to=dest_airports[0] if dest_airports else "MOCK",
+            d_time=int((today + timedelta(days=45)).timestamp()),
+            a_time=int((today + timedelta(days=55)).timestamp()),
+            segment_count=1,
+            airlines=["MOCK_AIR"],
+            source="mock",
+            deep_link="https://mock-airline.com/deal"
+        )
         deals.append(cheap_deal)
 
         for _ in range(4): # Generar 4 ofertas random extra
@@ -138,36 +315,71 @@ class AmadeusClient:
             dep_date = today + timedelta(days=days_out)
             ret_date = dep_date + timedelta(days=14)
             
-            deal = {
-                "price": float(price),
-                "cityCodeFrom": origin,
-                "cityCodeTo": dest,
-                "dTime": int(dep_date.timestamp()),
-                "aTime": int(ret_date.timestamp()),
-                "route": ["MOCK_SEGMENT_1", "MOCK_SEGMENT_2"],
-                "airlines": ["AA", "JL"],
-                "deep_link": "https://example.com",
-                "source": "mock"
-            }
+            deal = FlightOffer(
+                price=float(price),
+                city_from=origin,
+                city_to=dest,
+                d_time=int(dep_date.timestamp()),
+                a_time=int(ret_date.timestamp()),
+                segment_count=2,
+                airlines=["AA", "JL"],
+                source="mock",
+                deep_link="https://example.com"
+            )
             deals.append(deal)
         return deals
 
-    def search_flights(self, origin: str, dest_airports: List[str]) -> List[Dict[str, Any]]:
+    def search_flights(self, origin: str, dest_airports: List[str]) -> List[FlightOffer]:
         """
         Busca vuelos simulando la lógica anterior.
         Dado que Amadeus no permite rangos de fechas amplios, iteramos por días seleccionados.
+        Si `system.max_concurrent_requests` > 1 las consultas se ejecutan en un pool de hilos
+        compartiendo el rate limiter del cliente.
         """
-        # Chequear modo Mock
-        if self.config["system"].get("use_mock_api", False):
-            return self._generate_mock_deals(origin, dest_airports)
+        return self.search_many([(origin, dest_airports, self.config)])[0]
 
-        deals = []
-        endpoint = f"{self.HOST}/v2/shopping/flight-offers"
-        
-        config_sys = self.config["system"]
-        config_dates = self.config["dates"]
-        config_budget = self.config["budget"]
-        config_filters = self.config["filters"]
+    def search_many(self, jobs: List[Tuple[str, List[str], Dict[str, Any]]]) -> List[List[FlightOffer]]:
+        """
+        Busca varios watches (origen, destinos, config del watch) en una sola cola global de consultas.
+        Token, sesión, rate limiter y cache son los del cliente; cada consulta usa la config de su watch.
+        Retorna las ofertas de cada job por separado, en el orden de `jobs`.
+        """
+        results_by_job: List[List[FlightOffer]] = [[] for _ in jobs]
+        tasks = []
+        for job_idx, (origin, dest_airports, config) in enumerate(jobs):
+            # Chequear modo Mock
+            if config["system"].get("use_mock_api", False):
+                if config["system"].get("use_calendar_prefilter", False):
+                    results_by_job[job_idx] = self._generate_mock_calendar_deals(origin, dest_airports, config)
+                else:
+                    results_by_job[job_idx] = self._generate_mock_deals(origin, dest_airports)
+                continue
+            tasks.extend((job_idx, query, config) for query in self._plan_queries(origin, dest_airports, config))
+
+        if tasks:
+            max_workers = int(self.config["system"].get("max_concurrent_requests", 1))
+            # La normalización corre en su propio pool para no frenar los hilos de red
+            with NormalizationPool.from_config(self.config["system"]) as pool:
+                if max_workers > 1 and len(tasks) > 1:
+                    pending = self._run_queries_concurrent(tasks, max_workers, pool)
+                else:
+                    pending = self._run_queries_sequential(tasks, pool)
+
+                # Concatenamos en el orden del plan para que el resultado sea idéntico al modo secuencial
+                for (job_idx, _, _), future in zip(tasks, pending):
+                    results_by_job[job_idx].extend(future.result())
+
+        logger.info(f"Búsqueda finalizada. Total ofertas encontradas: {sum(len(r) for r in results_by_job)} "
+                    f"({len(tasks)} consultas, {len(jobs)} watches)")
+        return results_by_job
+
+    def _plan_queries(self, origin: str, dest_airports: List[str], config: Optional[Dict[str, Any]] = None) -> List[Tuple[str, str, str, str]]:
+        """
+        Genera la lista ordenada de consultas (origen, destino, salida, regreso) a ejecutar.
+        """
+        config = config or self.config
+        config_sys = config["system"]
+        config_dates = config["dates"]
 
         # Generar set de fechas a probar
         # Estrategia: Probar fechas random dentro de la ventana o secuencial.
@@ -195,20 +407,25 @@ class AmadeusClient:
              # run ONCE per destination with EXACT dates
              logger.info(f"Running EXACT DATE search: {specific_start} to {specific_end}")
              queries_per_dest = 1
+        elif config_sys.get("use_calendar_prefilter", False):
+            # Dos fases: calendario de precios por ruta y consultas detalladas sólo para el top-K
+            return [query for query, _ in self._calendar_candidates(origin, dest_airports, max_queries, config)]
+        elif config_dates.get("sweep_mode", False):
+            # Sweep determinista de la malla completa, repartida entre ejecuciones
+            planner = DateSweepPlanner(config_dates, self.store, today)
+            return planner.plan(origin, dest_airports, max_queries)
+        elif config_sys.get("query_planner") == "adaptive":
+            # Presupuesto dirigido a las celdas (destino, mes) con mayor valor esperado
+            planner = AdaptiveQueryPlanner(config, self.store, today)
+            return planner.plan(origin, dest_airports, max_queries)
         else:
             # Random Logic
             # Intentamos distribuir las queries entre los destinos
             queries_per_dest = max(1, max_queries // len(dest_airports))
-        
-        total_queries = queries_per_dest * len(dest_airports)
-        current_query = 0
-        
+
+        queries = []
         for dest in dest_airports:
             for _ in range(queries_per_dest):
-                current_query += 1
-                progress_pct = (current_query / total_queries) * 100
-                logger.info(f"[PROGRESS] {progress_pct:.0f}%")
-
                 if exact_mode and specific_start and specific_end:
                      depart_str = specific_start
                      return_str = specific_end
@@ -224,147 +441,266 @@ class AmadeusClient:
                     duration = random.randint(min_nights, max_nights)
                     return_date = depart_date + timedelta(days=duration)
                     return_str = return_date.strftime("%Y-%m-%d")
-                
-                # Comprobar aerolíneas
-                included_airlines = config_filters["airlines"].get("allowed", [])
-                excluded_airlines = config_filters["airlines"].get("blocked", [])
-                
-                params = {
-                    "originLocationCode": origin,
-                    "destinationLocationCode": dest,
-                    "departureDate": depart_str,
-                    "returnDate": return_str,
-                    "adults": 1,
-                    "max": 5, # Pocos resultados por fecha específica
-                    "currencyCode": config_budget["currency"]
-                }
-                
-                if included_airlines:
-                    params["includedAirlineCodes"] = ",".join(included_airlines)
-                if excluded_airlines:
-                    params["excludedAirlineCodes"] = ",".join(excluded_airlines)
- 
-                # rate limit basic handling
-                time.sleep(config_sys["sleep_seconds_between_requests"])
-                
-                try:
-                    logger.info(f"Amadeus: Buscando {origin}->{dest} ({depart_str} a {return_str})")
-                    response = self.session.get(endpoint, headers=self.get_headers(), params=params)
-                    
-                    if response.status_code == 429:
-                        logger.warning("Amadeus Rate Limit (429). Pausando...")
-                        time.sleep(5)
-                        continue
-                        
-                    response.raise_for_status()
-                    data = response.json().get('data', [])
-
-                    # Normalizar resultados
-                    normalized = self._normalize_results(data)
-                    deals.extend(normalized)
-                    
-                except requests.RequestException as e:
-                    logger.error(f"Fallo búsqueda Amadeus ({dest}, {depart_str}): {e}")
 
-        logger.info(f"Búsqueda finalizada. Total ofertas encontradas: {len(deals)}")
+                queries.append((origin, dest, depart_str, return_str))
+
+        return queries
+
+    def _calendar_candidates(self, origin: str, dest_airports: List[str], budget: int,
+                             config: Optional[Dict[str, Any]] = None) -> List[Tuple[Tuple[str, str, str, str], Optional[float]]]:
+        """
+        Fase 1 de la búsqueda en dos fases: una llamada al calendario de precios por ruta
+        y selección de los `calendar_top_k` pares de fechas más baratos de cada una.
+        Las rutas sin calendario (no cacheadas por Amadeus o error) usan pares al azar de la malla.
+        Retorna [(consulta, precio_aproximado)].
+        """
+        config = config or self.config
+        config_sys = config["system"]
+        top_k = int(config_sys.get("calendar_top_k") or max(1, budget // max(1, len(dest_airports))))
+        grid = DateSweepPlanner(config["dates"]).date_grid()
+
+        per_route = []
+        for dest in dest_airports:
+            calendar = self.get_price_calendar(origin, dest, config)
+            if calendar:
+                # Más baratos primero; sin pares repetidos
+                best = sorted(dict.fromkeys(calendar), key=lambda entry: entry[2])[:top_k]
+                per_route.append([((origin, dest, dep, ret), price) for dep, ret, price in best])
+                logger.info(f"Calendario {origin}->{dest}: {len(calendar)} fechas, top {len(best)} candidatos.")
+            else:
+                pairs = random.sample(grid, min(top_k, len(grid)))
+                per_route.append([((origin, dest, dep, ret), None) for dep, ret in pairs])
+
+        # Si el top-K de todas las rutas no cabe en el presupuesto, se reparte por turnos
+        # (el 1º de cada ruta, luego el 2º, ...) para que ningún destino se quede sin consultas
+        remaining = max(budget, len(dest_airports))
+        allotted = [0] * len(per_route)
+        for rank in range(top_k):
+            for idx, route in enumerate(per_route):
+                if remaining and rank < len(route):
+                    allotted[idx] += 1
+                    remaining -= 1
+        return [candidate for route, count in zip(per_route, allotted) for candidate in route[:count]]
+
+    def get_price_calendar(self, origin: str, dest: str, config: Optional[Dict[str, Any]] = None) -> List[Tuple[str, str, float]]:
+        """
+        Consulta /v1/shopping/flight-dates (Flight Cheapest Date Search) para toda la ventana.
+        Retorna [(salida, regreso, precio)] o [] si el endpoint no tiene datos para la ruta.
+        """
+        config = config or self.config
+        if config["system"].get("use_mock_api", False):
+            return self._generate_mock_calendar(origin, dest, config)
+
+        config_dates = config["dates"]
+        today = datetime.now()
+        window_start = (today + timedelta(days=config_dates["travel_window_start"])).strftime("%Y-%m-%d")
+        window_end = (today + timedelta(days=config_dates["travel_window_end"])).strftime("%Y-%m-%d")
+
+        endpoint = f"{self.HOST}/v1/shopping/flight-dates"
+        params = {
+            "origin": origin,
+            "destination": dest,
+            "departureDate": f"{window_start},{window_end}",
+            "oneWay": "false",
+            "duration": f"{config_dates['min_nights']},{config_dates['max_nights']}",
+            "viewBy": "DURATION"
+        }
+        if config["filters"].get("max_stopovers") == 0:
+            params["nonStop"] = "true"
+
+        cache_key = None
+        data = None
+        if self.response_cache:
+            cache_key = ResponseCache.make_key("flight-dates", params)
+            data = self.response_cache.get(cache_key)
+
+        try:
+            if data is None:
+                logger.info(f"Amadeus: Calendario de precios {origin}->{dest} ({window_start} a {window_end})")
+                response = self._request("GET", endpoint, params=params)
+                response.raise_for_status()
+                data = [
+                    {"departureDate": d["departureDate"], "returnDate": d.get("returnDate"), "price": {"total": d["price"]["total"]}}
+                    for d in response.json().get("data", [])
+                ]
+                if cache_key:
+                    self.response_cache.set(cache_key, data)
+
+            return [(d["departureDate"], d["returnDate"], float(d["price"]["total"])) for d in data if d.get("returnDate")]
+
+        except (requests.RequestException, KeyError, ValueError, TypeError) as e:
+            # flight-dates sólo cubre rutas cacheadas por Amadeus; no es un error grave
+            logger.warning(f"Calendario de precios no disponible {origin}->{dest}: {e}")
+            return []
+
+    def _generate_mock_calendar(self, origin: str, dest: str, config: Dict[str, Any]) -> List[Tuple[str, str, float]]:
+        """Calendario falso coherente con la malla de fechas de la ventana."""
+        rng = random.Random(f"{origin}-{dest}")
+        calendar = []
+        for dep, ret in DateSweepPlanner(config["dates"]).date_grid():
+            calendar.append((dep, ret, float(rng.randint(12000, 30000))))
+        return calendar
+
+    def _generate_mock_calendar_deals(self, origin: str, dest_airports: List[str], config: Dict[str, Any]) -> List[FlightOffer]:
+        """Ofertas MOCK para los candidatos del calendario, al precio aproximado del calendario."""
+        logger.info("Generando ofertas MOCK desde el calendario de precios...")
+        budget = config["system"].get("max_queries_per_run", len(dest_airports))
+        deals = []
+        for (_, dest, dep, ret), price in self._calendar_candidates(origin, dest_airports, budget, config):
+            dep_ts = int(datetime.strptime(dep, "%Y-%m-%d").timestamp())
+            ret_ts = int(datetime.strptime(ret, "%Y-%m-%d").timestamp())
+            deals.append(FlightOffer(
+                price=price if price is not None else float(random.randint(15000, 30000)),
+                city_from=origin,
+                city_to=dest,
+                d_time=dep_ts,
+                a_time=ret_ts,
+                segment_count=2,
+                airlines=["AA", "JL"],
+                source="mock"
+            ))
         return deals
 
-    def _normalize_results(self, amadeus_data: List[Dict]) -> List[Dict]:
+    def _run_queries_sequential(self, tasks: List[Tuple[int, Tuple[str, str, str, str], Dict[str, Any]]],
+                                pool: NormalizationPool) -> List[Future]:
+        results = []
+        total_queries = len(tasks)
+        for current_query, (_, query, config) in enumerate(tasks, start=1):
+            progress_pct = (current_query / total_queries) * 100
+            logger.info(f"[PROGRESS] {progress_pct:.0f}%")
+            results.append(pool.submit(self._fetch_offers(*query, config=config)))
+        return results
+
+    def _run_queries_concurrent(self, tasks: List[Tuple[int, Tuple[str, str, str, str], Dict[str, Any]]],
+                                max_workers: int, pool: NormalizationPool) -> List[Future]:
+        """
+        Ejecuta las consultas (job, consulta, config) en un pool acotado de hilos.
+        Cada hilo sólo descarga y entrega las ofertas crudas a `pool`; los Futures de
+        normalización se devuelven en el mismo orden que `tasks`.
+        """
+        # Obtenemos el token antes de lanzar los hilos para no pedirlo N veces en paralelo.
+        # Si falla, cada consulta lo reintenta y falla por separado, igual que en modo secuencial.
+        try:
+            self._get_token()
+        except requests.RequestException as e:
+            logger.error(f"No se pudo obtener el token antes de las consultas concurrentes: {e}")
+
+        total_queries = len(tasks)
+        completed = 0
+        progress_lock = threading.Lock()
+        results: List[Optional[Future]] = [None] * total_queries
+
+        def _fetch_and_submit(query, config) -> Future:
+            return pool.submit(self._fetch_offers(*query, config=config))
+
+        logger.info(f"Ejecutando {total_queries} consultas con {max_workers} hilos.")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_fetch_and_submit, query, config): idx
+                for idx, (_, query, config) in enumerate(tasks)
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                with progress_lock:
+                    completed += 1
+                    progress_pct = (completed / total_queries) * 100
+                logger.info(f"[PROGRESS] {progress_pct:.0f}%")
+
+        return results
+
+    def _fetch_offers(self, origin: str, dest: str, depart_str: str, return_str: str,
+                      config: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """
-        Convierte la respuesta de Amadeus al formato dict plano esperado por scoring.py
+        Descarga las ofertas de una consulta a /v2/shopping/flight-offers, reducidas con _slim_offer
+        y sin normalizar (eso ocurre fuera de los hilos de red, ver normalization.py).
         """
-        normalized_deals = []
-        for offer in amadeus_data:
+        config = config or self.config
+        endpoint = f"{self.HOST}/v2/shopping/flight-offers"
+        config_budget = config["budget"]
+        config_filters = config["filters"]
+
+        # Comprobar aerolíneas
+        included_airlines = config_filters["airlines"].get("allowed", [])
+        excluded_airlines = config_filters["airlines"].get("blocked", [])
+        
+        params = {
+            "originLocationCode": origin,
+            "destinationLocationCode": dest,
+            "departureDate": depart_str,
+            "returnDate": return_str,
+            "adults": 1,
+            "max": config["system"].get("max_offers_per_query", 5), # Pocos resultados por fecha específica
+            "currencyCode": config_budget["currency"]
+        }
+        
+        if included_airlines:
+            params["includedAirlineCodes"] = ",".join(included_airlines)
+        if excluded_airlines:
+            params["excludedAirlineCodes"] = ",".join(excluded_airlines)
+
+        # Un hit de cache evita tanto la petición HTTP como la espera del rate limiter
+        cache_key = None
+        if self.response_cache:
+            cache_key = ResponseCache.make_key("flight-offers", params)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Amadeus (cache): {origin}->{dest} ({depart_str} a {return_str})")
+                return cached
+
+        try:
+            logger.info(f"Amadeus: Buscando {origin}->{dest} ({depart_str} a {return_str})")
+            # El rate limiter espacia las peticiones y reintenta los 429
+            response = self._request("GET", endpoint, params=params, stream=True)
             try:
-                # 1. Precio
-                price = float(offer['price']['total'])
-                
-                # 2. Itinerarios
-                itineraries = offer['itineraries']
-                if not itineraries:
-                    continue
-                
-                # Ida
-                outbound = itineraries[0]['segments']
-                # Vuelta (si existe)
-                inbound = itineraries[1]['segments'] if len(itineraries) > 1 else []
-                
-                first_seg = outbound[0]
-                last_seg = outbound[-1]
-                
-                # Timestamp salida
-                dep_at = first_seg['departure']['at'] # "2024-12-01T10:00:00"
-                dt_obj = datetime.strptime(dep_at, "%Y-%m-%dT%H:%M:%S")
-                d_time_ts = dt_obj.timestamp()
-                
-                # Timestamp llegada (vuelta) - approx usando primer seg de vuelta o último de ida
-                # scoring.py no usa aTime críticamente más que para logs/info
-                if inbound:
-                    ret_at = inbound[0]['departure']['at']
-                    rt_obj = datetime.strptime(ret_at, "%Y-%m-%dT%H:%M:%S")
-                    a_time_ts = rt_obj.timestamp()
-                else:
-                    a_time_ts = 0
+                response.raise_for_status()
+                # Parseo en streaming: reducimos oferta por oferta sin cargar el documento completo
+                # (la etapa "parse" incluye la lectura del cuerpo, que llega por partes)
+                with instrumentation.stage("parse"):
+                    slim_offers = list(self._stream_slim_offers(response))
+            finally:
+                response.close()
 
-                # 3. Datos Ruta
-                origin_code = first_seg['departure']['iataCode']
-                dest_code = last_seg['arrival']['iataCode']
-                
-                # 4. Aerolíneas
-                # validatingAirlineCodes suele ser lista de strings ['AA', 'UA']
-                val_airlines = offer.get('validatingAirlineCodes', [])
-                if val_airlines:
-                     airlines = list(set(val_airlines))
-                else:
-                    # Fallback a segmentos
-                    airlines = list(set([s['carrierCode'] for s in outbound]))
-
-                # 5. Route (lista de paradas/segmentos) para display
-                # El formato anterior usaba una lista de dicts. 
-                # Simplificaremos a lista de strings para log o lista de objects si scoring lo requiere.
-                # scoring.py usa len(deal.get("route", [])) para contar segmentos.
-                # Combinamos segmentos de ida y vuelta
-                all_segments = outbound + inbound
-                
-                # Generar link de Google Flights (Query más explícita)
-                dep_date_str = dt_obj.strftime("%Y-%m-%d")
-                
-                # Google Flights: "Flights from ORIGIN to DEST on DATE returning DATE"
-                gf_query = f"Flights from {origin_code} to {dest_code} on {dep_date_str}"
-                
-                # Skyscanner: https://www.skyscanner.com/transport/flights/mex/gye/240501/240510
-                # Skyscanner format uses YYMMDD
-                sky_dep = dt_obj.strftime("%y%m%d")
-                sky_ret = ""
-                
-                if inbound:
-                    rt_obj = datetime.strptime(inbound[0]['departure']['at'], "%Y-%m-%dT%H:%M:%S")
-                    ret_str = rt_obj.strftime("%Y-%m-%d")
-                    gf_query += f" returning {ret_str}"
-                    
-                    sky_ret = rt_obj.strftime("%y%m%d")
-                
-                # Construir URLs
-                gf_link = f"https://www.google.com/travel/flights?q={gf_query.replace(' ', '+')}"
-                sky_link = f"https://www.skyscanner.com.mx/transport/vuelos/{origin_code.lower()}/{dest_code.lower()}/{sky_dep}/{sky_ret}"
-
-                deal_dict = {
-                    "price": price,
-                    "cityCodeFrom": origin_code,
-                    "cityCodeTo": dest_code,
-                    "dTime": int(d_time_ts),
-                    "aTime": int(a_time_ts),
-                    "route": all_segments, 
-                    "airlines": airlines,
-                    "deep_link": gf_link,
-                    "backup_link": sky_link,
-                    "source": "amadeus"
-                }
-                
-                normalized_deals.append(deal_dict)
+            if cache_key:
+                self.response_cache.set(cache_key, slim_offers)
+            return slim_offers
+            
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Fallo búsqueda Amadeus ({dest}, {depart_str}): {e}")
+            return []
 
-            except (KeyError, ValueError, IndexError) as e:
-                logger.warning(f"Error parseando oferta Amadeus: {e}")
-                continue
-                
-        return normalized_deals
+    def _stream_slim_offers(self, response: requests.Response) -> Iterator[Dict]:
+        """
+        Recorre `data[]` de la respuesta de forma incremental y produce cada oferta reducida
+        a los campos necesarios (lo que se guarda en el cache y se normaliza).
+        `dictionaries` y el resto del documento no se leen.
+        """
+        for raw_offer in iter_json_array(response.iter_content(chunk_size=16384), "data"):
+            slim = self._slim_offer(raw_offer)
+            if slim is not None:
+                yield slim
+
+    @staticmethod
+    def _slim_offer(offer: Dict) -> Optional[Dict]:
+        """
+        Reduce una oferta de Amadeus a los campos que usa la normalización
+        (precio, aerolíneas validadoras y por segmento: IATA, hora de salida y carrier).
+        """
+        try:
+            return {
+                "price": {"total": offer["price"]["total"]},
+                "validatingAirlineCodes": offer.get("validatingAirlineCodes", []),
+                "itineraries": [
+                    {"segments": [
+                        {
+                            "departure": {"iataCode": seg["departure"]["iataCode"], "at": seg["departure"]["at"]},
+                            "arrival": {"iataCode": seg["arrival"]["iataCode"]},
+                            "carrierCode": seg.get("carrierCode")
+                        }
+                        for seg in itinerary["segments"]
+                    ]}
+                    for itinerary in offer["itineraries"]
+                ]
+            }
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Error parseando oferta Amadeus: {e}")
+            return None
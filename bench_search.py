@@ -0,0 +1,137 @@
+"""
+Benchmark: búsqueda secuencial vs concurrente contra un servidor HTTP local (stub de Amadeus).
+
+Uso:
+    python bench_search.py [num_queries] [workers] [latencia_ms]
+"""
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from amadeus_client import AmadeusClient
+from http_transport import connection_stats
+
+logging.basicConfig(level=logging.WARNING)
+
+LATENCY_SECONDS = 0.2
+
+
+class StubAmadeusHandler(BaseHTTPRequestHandler):
+    """Responde token OAuth y flight-offers deterministas con latencia artificial."""
+
+    # Keep-alive como la API real
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._send_json({"access_token": "stub-token", "expires_in": 1799})
+
+    def do_GET(self):
+        time.sleep(LATENCY_SECONDS)
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        origin = params.get("originLocationCode", "MEX")
+        dest = params.get("destinationLocationCode", "NRT")
+        dep = params.get("departureDate", "2026-01-01")
+        ret = params.get("returnDate", "2026-01-10")
+        # Precio determinista en función de la consulta
+        base = sum(ord(c) for c in f"{dest}{dep}{ret}")
+        offers = []
+        for i in range(5):
+            offers.append({
+                "price": {"total": f"{15000 + base * 3 + i * 250:.2f}"},
+                "validatingAirlineCodes": ["AM"],
+                "itineraries": [
+                    {"segments": [{
+                        "departure": {"iataCode": origin, "at": f"{dep}T10:00:00"},
+                        "arrival": {"iataCode": dest, "at": f"{dep}T22:00:00"},
+                        "carrierCode": "AM",
+                    }]},
+                    {"segments": [{
+                        "departure": {"iataCode": dest, "at": f"{ret}T12:00:00"},
+                        "arrival": {"iataCode": origin, "at": f"{ret}T23:00:00"},
+                        "carrierCode": "AM",
+                    }]},
+                ],
+            })
+        self._send_json({"data": offers})
+
+
+def build_config(num_queries, workers, rps):
+    return {
+        "system": {
+            "max_queries_per_run": num_queries,
+            "max_concurrent_requests": workers,
+            "max_requests_per_second": rps,
+            "sleep_seconds_between_requests": 0,
+            # Sin cache: queremos medir la red, no los hits
+            "use_response_cache": False,
+            "token_cache_path": None,
+        },
+        "dates": {
+            "travel_window_start": 30,
+            "travel_window_end": 150,
+            "min_nights": 7,
+            "max_nights": 14,
+        },
+        "budget": {"currency": "MXN", "max_price": 50000},
+        "filters": {"airlines": {"allowed": [], "blocked": []}},
+    }
+
+
+def timed_search(host, config, dests):
+    client = AmadeusClient("id", "secret", config)
+    client.HOST = host
+    random.seed(1234)
+    start = time.perf_counter()
+    deals = client.search_flights("MEX", dests)
+    return time.perf_counter() - start, deals
+
+
+def main():
+    global LATENCY_SECONDS
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    if len(sys.argv) > 3:
+        LATENCY_SECONDS = int(sys.argv[3]) / 1000.0
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAmadeusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    dests = ["NRT", "HND", "KIX", "ITM", "CTS", "FUK"]
+
+    try:
+        # Mismo presupuesto de RPS para ambos modos; sólo cambia la concurrencia
+        rps = 20
+        seq_time, seq_deals = timed_search(host, build_config(num_queries, 1, rps), dests)
+        conc_time, conc_deals = timed_search(host, build_config(num_queries, workers, rps), dests)
+    finally:
+        server.shutdown()
+
+    print(f"Consultas: {num_queries} | Latencia stub: {LATENCY_SECONDS * 1000:.0f} ms | RPS máx: {rps}")
+    print(f"Secuencial:            {seq_time:.2f} s ({len(seq_deals)} ofertas)")
+    print(f"Concurrente ({workers} hilos): {conc_time:.2f} s ({len(conc_deals)} ofertas)")
+    print(f"Speedup: {seq_time / conc_time:.1f}x")
+    print(f"Resultados idénticos: {seq_deals == conc_deals}")
+    for host, stats in connection_stats().items():
+        print(f"Conexiones {host}: {stats['connections']} abiertas / {stats['requests']} peticiones ({stats['reused']} reutilizadas)")
+
+
+if __name__ == "__main__":
+    main()
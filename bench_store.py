@@ -0,0 +1,104 @@
+"""
+Micro-benchmark: costo por deal de la evaluación (baseline + dedupe) en DealStore.
+Compara el patrón anterior (una conexión SQLite por operación) con la conexión persistente.
+
+Uso:
+    python bench_store.py [num_deals] [muestras_historial]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from offers import FlightOffer
+from store import DealStore
+from scoring import DealScorer
+
+CONFIG = {
+    "scoring": {"baseline_days": 60, "min_samples": 5, "discount_min": 0.1,
+                "discount_max": 0.6, "dedupe_drop_pct": 0.05},
+    "budget": {"max_price": 50000, "currency": "MXN"},
+}
+
+
+class ConnectPerCallStore(DealStore):
+    """Reproduce el comportamiento previo: abrir y cerrar la conexión en cada operación."""
+
+    def _get_conn(self):
+        # Sin cache por hilo: cada llamada abre una conexión nueva (se libera al salir de alcance)
+        return sqlite3.connect(self.db_path)
+
+    def get_last_notification(self, deal_hash):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute('SELECT last_price, last_notified_at FROM notifications WHERE deal_hash = ?',
+                           (deal_hash,)).fetchone()
+        conn.close()
+        return {"last_price": row[0], "last_notified_at": row[1]} if row else None
+
+
+def seed(db_path, routes, months, samples):
+    conn = sqlite3.connect(db_path)
+    rows = [(random.choice(routes), random.choice(months), random.uniform(10000, 30000), "MXN")
+            for _ in range(samples)]
+    conn.executemany('INSERT INTO price_history (route, travel_month, price, currency) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def build_deals(num_deals, dests):
+    today = datetime.now()
+    deals = []
+    for _ in range(num_deals):
+        dep = today + timedelta(days=random.randint(30, 150))
+        deals.append(FlightOffer(
+            price=float(random.randint(8000, 30000)),
+            city_from="MEX",
+            city_to=random.choice(dests),
+            d_time=int(dep.timestamp()),
+            a_time=int((dep + timedelta(days=10)).timestamp()),
+            segment_count=2,
+            airlines=["AM"],
+        ))
+    return deals
+
+
+def time_evaluation(store, deals):
+    scorer = DealScorer(CONFIG, store)
+    start = time.perf_counter()
+    for deal in deals:
+        result = scorer.evaluate_deal(deal)
+        store.get_last_notification(result.deal_hash)
+    return (time.perf_counter() - start) / len(deals)
+
+
+def main():
+    num_deals = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    random.seed(42)
+
+    dests = ["NRT", "HND", "KIX", "ITM", "CTS", "FUK"]
+    today = datetime.now()
+    months = sorted({(today + timedelta(days=d)).strftime("%Y-%m") for d in range(30, 151)})
+    deals = build_deals(num_deals, dests)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        with DealStore(db_path):
+            pass
+        seed(db_path, [f"MEX-{d}" for d in dests], months, samples)
+
+        before = time_evaluation(ConnectPerCallStore(db_path), deals)
+        with DealStore(db_path) as store:
+            after = time_evaluation(store, deals)
+
+    print(f"Deals: {num_deals} | Muestras en historial: {samples}")
+    print(f"Conexión por operación: {before * 1e6:8.1f} us/deal")
+    print(f"Conexión persistente:   {after * 1e6:8.1f} us/deal")
+    print(f"Speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
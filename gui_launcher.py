@@ -11,6 +11,7 @@ import random # Importar random
 from datetime import datetime, timedelta
 from tkinter import messagebox
 import main
+from airport_index import get_default_index
 
 # Configuración de apariencia
 ctk.set_appearance_mode("Dark")
@@ -75,7 +76,7 @@ class DealResultsWindow(ctk.CTkToplevel):
         scroll = ctk.CTkScrollableFrame(self, fg_color="transparent")
         scroll.pack(fill="both", expand=True, padx=10, pady=10)
         
-        deals.sort(key=lambda x: x.get("price", 0)) # Sort by price
+        deals.sort(key=lambda x: x.price) # Sort by price
 
         for i, deal in enumerate(deals):
             is_best = (i == 0)
@@ -96,18 +97,18 @@ class DealResultsWindow(ctk.CTkToplevel):
             badge.pack(anchor="e", padx=10, pady=(5,0))
 
         # Header: Route
-        route_str = f"{deal.get('cityCodeFrom')} ✈️ {deal.get('cityCodeTo')}"
+        route_str = f"{deal.city_from} ✈️ {deal.city_to}"
         ctk.CTkLabel(card, text=route_str, font=ctk.CTkFont(size=18, weight="bold"), text_color="white").pack(anchor="w", padx=15, pady=(5,0))
         
         # Grid Info
         info_frame = ctk.CTkFrame(card, fg_color="transparent")
         info_frame.pack(fill="x", padx=15, pady=5)
         
-        price = deal.get("price")
+        price = deal.price
         
         # Dates
-        ts_dep = deal.get("dTime")
-        ts_ret = deal.get("aTime")
+        ts_dep = deal.d_time
+        ts_ret = deal.a_time
         
         fmt = '%d %b'
         date_dep_str = datetime.fromtimestamp(ts_dep).strftime(fmt) if ts_dep else "N/A"
@@ -125,29 +126,11 @@ class DealResultsWindow(ctk.CTkToplevel):
         if ts_ret:
              ctk.CTkLabel(right_info, text=f"RETURN: {date_ret_str}", font=ctk.CTkFont(size=12, weight="bold")).pack(anchor="e")
         
-        airlines = ", ".join(deal.get("airlines", []))[:20] # Truncate if long
+        airlines = ", ".join(deal.airlines)[:20] # Truncate if long
         ctk.CTkLabel(right_info, text=f"🛩️ {airlines}", font=ctk.CTkFont(size=12), text_color="gray").pack(anchor="e")
 
-        # Button Logic: PRIORITIZE SKYSCANNER (backup_link)
-        link = deal.get("backup_link") or deal.get("deep_link")
-        
-        if not link and deal.get("cityCodeFrom") and deal.get("cityCodeTo") and deal.get("dTime"):
-            # Fallback: Regenerate Skyscanner Link (YYMMDD format)
-            try:
-                origin = deal["cityCodeFrom"].lower()
-                dest = deal["cityCodeTo"].lower()
-                dep_dt = datetime.fromtimestamp(deal["dTime"])
-                sky_dep = dep_dt.strftime("%y%m%d")
-                sky_ret = ""
-                
-                if deal.get("aTime") and deal["aTime"] > deal["dTime"]:
-                     ret_dt = datetime.fromtimestamp(deal["aTime"])
-                     if ret_dt > dep_dt:
-                        sky_ret = ret_dt.strftime("%y%m%d")
-                
-                link = f"https://www.skyscanner.com.mx/transport/vuelos/{origin}/{dest}/{sky_dep}/{sky_ret}"
-            except Exception:
-                link = None
+        # Button Logic: PRIORITIZE SKYSCANNER (backup_link, generado bajo demanda por FlightOffer)
+        link = deal.backup_link or deal.deep_link
 
         if link:
              btn_text = "🔗 View Deal (Skyscanner)"
@@ -176,26 +159,9 @@ class FlightMonitorGUI(ctk.CTk):
     """
     CONFIG_PATH = "config.yaml"
 
-    LOCATIONS = {
-        "Mexico": ["Whole Country (MX)", "Mexico City (MEX)", "Cancun (CUN)", "Guadalajara (GDL)", "Monterrey (MTY)", "Tijuana (TIJ)"],
-        "United States": ["Whole Country (US)", "New York (JFK)", "Miami (MIA)", "Los Angeles (LAX)", "Las Vegas (LAS)", "Orlando (MCO)"],
-        "Colombia": ["Whole Country (CO)", "Bogota (BOG)", "Medellin (MDE)", "Cartagena (CTG)"],
-        "Argentina": ["Whole Country (AR)", "Buenos Aires (EZE)"],
-        "Brazil": ["Whole Country (BR)", "Sao Paulo (GRU)", "Rio de Janeiro (GIG)"],
-        "Peru": ["Whole Country (PE)", "Lima (LIM)"],
-        "Chile": ["Whole Country (CL)", "Santiago (SCL)"],
-        "Ecuador": ["Whole Country (EC)", "Quito (UIO)", "Guayaquil (GYE)"],
-        "Costa Rica": ["Whole Country (CR)", "San Jose (SJO)"],
-        "Panama": ["Whole Country (PA)", "Panama City (PTY)"],
-        "Spain": ["Whole Country (ES)", "Madrid (MAD)", "Barcelona (BCN)"],
-        "France": ["Whole Country (FR)", "Paris (CDG)"],
-        "Italy": ["Whole Country (IT)", "Rome (FCO)"],
-        "Germany": ["Whole Country (DE)", "Frankfurt (FRA)"],
-        "United Kingdom": ["Whole Country (GB)", "London (LHR)"],
-        "Japan": ["Whole Country (JP)", "Tokyo (HND)"],
-        "Canada": ["Whole Country (CA)", "Toronto (YYZ)", "Vancouver (YVR)"],
-        "Custom / Other": []
-    }
+    # País -> ["Whole Country (XX)", "Ciudad (IATA)", ...] generado desde el índice offline
+    AIRPORT_INDEX = get_default_index()
+    LOCATIONS = {**AIRPORT_INDEX.gui_locations(), "Custom / Other": []}
 
     def __init__(self):
         super().__init__()
@@ -527,6 +493,17 @@ class FlightMonitorGUI(ctk.CTk):
                 combo_city.set("")
                 
         combo_country.configure(command=on_country_change)
+
+        # Búsqueda por prefijo (IATA, ciudad o país) sobre el índice completo
+        def on_city_typed(event):
+            text = combo_city.get()
+            if len(text.strip()) < 2:
+                return
+            matches = [a.label for a in self.AIRPORT_INDEX.search(text, limit=30)]
+            if matches:
+                combo_city.configure(values=matches)
+
+        combo_city.bind("<KeyRelease>", on_city_typed)
         
         return combo_city
 
@@ -0,0 +1,131 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+_shared_sessions: Dict[tuple, requests.Session] = {}
+_shared_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter con timeout por defecto: ninguna petición queda colgada de un socket muerto.
+    Un `timeout` explícito en la llamada tiene prioridad.
+    """
+
+    def __init__(self, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _settings(config_sys: Optional[Dict[str, Any]]) -> tuple:
+    config_sys = config_sys or {}
+    workers = int(config_sys.get("max_concurrent_requests", 1))
+    return (
+        int(config_sys.get("http_pool_connections", 10)),
+        # Al menos una conexión por hilo de búsqueda para no descartar conexiones calientes
+        int(config_sys.get("http_pool_maxsize", max(10, workers))),
+        float(config_sys.get("http_connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+        float(config_sys.get("http_read_timeout", DEFAULT_READ_TIMEOUT)),
+        int(config_sys.get("http_max_retries", 2)),
+    )
+
+
+def create_session(config_sys: Optional[Dict[str, Any]] = None) -> requests.Session:
+    """
+    Session con pool de conexiones keep-alive, timeouts por defecto, gzip y reintentos
+    sólo para métodos idempotentes (GET/HEAD/OPTIONS) ante errores de conexión y 5xx.
+    Los 429 no se reintentan aquí: los maneja el RateLimiter de cada cliente.
+    """
+    pool_connections, pool_maxsize, connect_timeout, read_timeout, max_retries = _settings(config_sys)
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        raise_on_status=False,
+        # Por defecto urllib3 reintenta cualquier 429 con Retry-After antes de que lo vea el cliente
+        respect_retry_after_header=False
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=(connect_timeout, read_timeout),
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    # Latencia por endpoint, peticiones y 429 para el reporte de ejecución
+    session.hooks["response"].append(instrumentation.record_response)
+    return session
+
+
+def get_shared_session(config_sys: Optional[Dict[str, Any]] = None) -> requests.Session:
+    """
+    Session compartida por proceso (Amadeus, Twilio, ...) para reutilizar conexiones calientes.
+    Se crea una por combinación de ajustes de transporte.
+    """
+    key = _settings(config_sys)
+    with _shared_lock:
+        session = _shared_sessions.get(key)
+        if session is None:
+            session = create_session(config_sys)
+            _shared_sessions[key] = session
+        return session
+
+
+def connection_stats(session: Optional[requests.Session] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Reutilización de conexiones por host: conexiones abiertas vs peticiones servidas.
+    Sin `session` agrega todas las sessions compartidas.
+    """
+    if session is None:
+        with _shared_lock:
+            sessions = list(_shared_sessions.values())
+    else:
+        sessions = [session]
+
+    stats: Dict[str, Dict[str, int]] = {}
+    for sess in sessions:
+        adapters = {id(a): a for a in sess.adapters.values()}.values()
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host_stats = stats.setdefault(f"{pool.scheme}://{pool.host}:{pool.port}",
+                                              {"connections": 0, "requests": 0})
+                host_stats["connections"] += pool.num_connections
+                host_stats["requests"] += pool.num_requests
+
+    for host_stats in stats.values():
+        host_stats["reused"] = max(0, host_stats["requests"] - host_stats["connections"])
+    return stats
+
+
+def log_connection_stats(session: Optional[requests.Session] = None):
+    for host, host_stats in connection_stats(session).items():
+        logger.info(f"HTTP {host}: {host_stats['requests']} peticiones, "
+                    f"{host_stats['connections']} conexiones nuevas, {host_stats['reused']} reutilizadas")
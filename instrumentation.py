@@ -0,0 +1,222 @@
+import bisect
+import cProfile
+import json
+import logging
+import os
+import platform
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato del reporte JSON (subirla si cambian las llaves)
+REPORT_VERSION = 1
+
+# Límites superiores (ms) de los buckets del histograma de latencias; el último es +inf
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class RunMetrics:
+    """
+    Métricas de una ejecución: timers por etapa, histogramas de latencia por endpoint y contadores.
+    Seguro entre hilos. Los tiempos por etapa son acumulados: con consultas en paralelo
+    la suma de una etapa puede superar el tiempo real de la ejecución.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self._latencies: Dict[str, List[float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, endpoint: str, seconds: float):
+        """Registra la latencia de una petición HTTP a `endpoint` (método + host + ruta)."""
+        with self._lock:
+            self._latencies.setdefault(endpoint, []).append(seconds * 1000)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    @staticmethod
+    def _histogram(samples_ms: List[float]) -> Dict[str, Any]:
+        ordered = sorted(samples_ms)
+        buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for value in ordered:
+            buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+
+        def percentile(pct: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))], 1)
+
+        labels = [f"<={limit}ms" for limit in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": len(ordered),
+            "mean_ms": round(sum(ordered) / len(ordered), 1),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(ordered[-1], 1),
+            "buckets": {label: n for label, n in zip(labels, buckets) if n},
+        }
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self.stages.items()}
+            counters = dict(self.counters)
+            latencies = {endpoint: list(samples) for endpoint, samples in self._latencies.items()}
+
+        for entry in stages.values():
+            entry["seconds"] = round(entry["seconds"], 4)
+            entry["max_seconds"] = round(entry["max_seconds"], 4)
+
+        # Ofertas por segundo sobre el tiempo real de la búsqueda (descarga + normalización)
+        search_seconds = stages.get("search", {}).get("seconds", 0.0)
+        offers = counters.get("offers", 0)
+        return {
+            "report_version": REPORT_VERSION,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "duration_seconds": round(self.elapsed(), 3),
+            "python": platform.python_version(),
+            "stages": stages,
+            "counters": counters,
+            "offers_per_second": round(offers / search_seconds, 1) if search_seconds else None,
+            "http_latency": {endpoint: self._histogram(samples)
+                             for endpoint, samples in sorted(latencies.items()) if samples},
+        }
+
+
+# Métricas de la ejecución en curso (una a la vez por proceso, compartidas por todos los hilos)
+_current = RunMetrics()
+
+
+def start_run() -> RunMetrics:
+    """Empieza métricas nuevas para una ejecución y las retorna."""
+    global _current
+    _current = RunMetrics()
+    return _current
+
+
+def current() -> RunMetrics:
+    return _current
+
+
+def stage(name: str):
+    """Timer de etapa sobre la ejecución en curso: `with stage("scoring"): ...`."""
+    return _current.stage(name)
+
+
+def incr(name: str, amount: int = 1):
+    _current.incr(name, amount)
+
+
+def record_response(response, *args, **kwargs):
+    """
+    Hook de respuesta de requests (ver http_transport.create_session): latencia por endpoint
+    hasta recibir los encabezados, número de peticiones y 429.
+    """
+    request = response.request
+    parts = urlsplit(request.url)
+    endpoint = f"{request.method} {parts.netloc}{parts.path}"
+    metrics = _current
+    metrics.observe(endpoint, response.elapsed.total_seconds())
+    metrics.incr("http_requests")
+    if response.status_code == 429:
+        metrics.incr("http_429")
+    elif response.status_code >= 400:
+        metrics.incr("http_errors")
+
+
+class Profiler:
+    """
+    Captura opcional de una ejecución: cProfile (hilo principal, volcado a `cpu_path` para
+    pstats/snakeviz) y tracemalloc (pico de memoria y principales líneas que asignan).
+    Los hilos de búsqueda no entran en cProfile; su tiempo lo cubren los timers por etapa.
+    """
+
+    def __init__(self, cpu: bool = False, memory: bool = False, cpu_path: Optional[str] = None, top: int = 15):
+        self.cpu = cpu
+        self.memory = memory
+        self.cpu_path = cpu_path
+        self.top = top
+        self._profile: Optional[cProfile.Profile] = None
+        self._own_tracemalloc = False
+        self.result: Dict[str, Any] = {}
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        if self.cpu:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profile:
+            self._profile.disable()
+            if self.cpu_path:
+                try:
+                    self._profile.dump_stats(self.cpu_path)
+                    self.result["cpu_profile"] = self.cpu_path
+                except OSError as e:
+                    logger.warning(f"No se pudo guardar el perfil de CPU ({self.cpu_path}): {e}")
+        if self.memory and tracemalloc.is_tracing():
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            self.result["memory"] = {
+                "current_bytes": current_bytes,
+                "peak_bytes": peak_bytes,
+                "top_allocations": [
+                    {"location": str(stat.traceback[0]), "bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.top]
+                ],
+            }
+            if self._own_tracemalloc:
+                tracemalloc.stop()
+        return False
+
+
+def write_report(path: str, report: Dict[str, Any]) -> bool:
+    """Escribe el reporte JSON de forma atómica (un lector nunca ve un archivo a medias)."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logger.warning(f"No se pudo escribir el reporte de ejecución ({path}): {e}")
+        return False
+
+
+def log_summary(report: Dict[str, Any]):
+    stages = ", ".join(f"{name} {entry['seconds']:.2f}s" for name, entry in report["stages"].items())
+    logger.info(f"Tiempos por etapa: {stages}")
+    counters = report["counters"]
+    logger.info(f"Peticiones HTTP: {counters.get('http_requests', 0)} "
+                f"(429: {counters.get('http_429', 0)}), cache hits: {counters.get('cache_hits', 0)}, "
+                f"ofertas/s: {report['offers_per_second']}")
@@ -0,0 +1,100 @@
+import codecs
+import json
+from typing import Any, Iterable, Iterator, Union
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+class _StreamBuffer:
+    """
+    Ventana deslizante sobre un flujo de chunks (bytes o str).
+    Sólo conserva el texto aún no consumido, así la memoria no crece con el documento.
+    """
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Agrega el siguiente chunk al buffer. Retorna False al final del flujo."""
+        while not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                chunk = self._utf8.decode(b"", final=True)
+            elif isinstance(chunk, bytes):
+                chunk = self._utf8.decode(chunk)
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self) -> str:
+        """Siguiente carácter significativo (sin espacios); '' al final del flujo."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"JSON inválido: se esperaba '{char}' en la posición {self.pos}")
+        self.pos += 1
+
+    def decode_value(self) -> Any:
+        """Decodifica un valor JSON completo, leyendo más chunks si está cortado."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # Un número al borde del buffer podría continuar en el siguiente chunk: "1e" se decodifica
+            # como 1 y deja "e" sin leer, así que basta con que lo que resta sean caracteres numéricos
+            if (not self.eof and isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and all(c in _NUMBER_CHARS for c in self.text[end:]) and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]], key: str = "data") -> Iterator[Any]:
+    """
+    Itera los elementos del arreglo `key` de un objeto JSON de nivel superior, uno a la vez,
+    sin materializar el documento completo. Los demás campos de nivel superior que aparecen
+    antes se decodifican y descartan; los posteriores ni siquiera se leen.
+    """
+    buf = _StreamBuffer(chunks)
+    buf.expect("{")
+    if buf.peek() == "}":
+        return
+
+    while True:
+        name = buf.decode_value()
+        buf.expect(":")
+        if name == key:
+            buf.expect("[")
+            if buf.peek() == "]":
+                return
+            while True:
+                yield buf.decode_value()
+                sep = buf.peek()
+                if sep == "]":
+                    return
+                buf.expect(",")
+        # Campo que no nos interesa (p.ej. 'meta'): decodificar y descartar
+        buf.decode_value()
+        if buf.peek() == "}":
+            return
+        buf.expect(",")
@@ -1,22 +1,37 @@
 import yaml
 import os
+import argparse
 import logging
+import signal
+import sqlite3
+import threading
 import time
 from datetime import datetime
 from collections import defaultdict
 from dotenv import load_dotenv
 
+import instrumentation
 from store import DealStore
+from offers import unique_offers
 from amadeus_client import AmadeusClient
 from scoring import DealScorer
 from notifier_whatsapp import WhatsAppNotifier
+from watches import Watch, load_watches
+from scheduler import parse_schedule, due_names
+from http_transport import connection_stats, log_connection_stats
+from notification_dispatcher import NotificationDispatcher
+
+LOG_FILE = "flight_monitor.log"
+# Reporte JSON de la última ejecución y perfil de CPU opcional, junto al log
+RUN_REPORT_FILE = "flight_monitor_report.json"
+CPU_PROFILE_FILE = "flight_monitor.prof"
 
 # Configuración básica de logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler("flight_monitor.log"),
+        logging.FileHandler(LOG_FILE),
         logging.StreamHandler()
     ]
 )
@@ -28,14 +43,49 @@ def load_config(path: str = "config.yaml"):
     with open(path, 'r') as f:
         return yaml.safe_load(f)
 
-def run():
+def run(config_path: str = "config.yaml", profile: bool = False):
     # 1. Cargar Entorno y Config
     load_dotenv()
-    config = load_config()
+    config = load_config(config_path)
+    if profile:
+        config["system"].update(profile_cpu=True, profile_memory=True)
     
     # 2. Inicializar Componentes
-    store = DealStore()
-    
+    # El store mantiene una conexión abierta durante toda la ejecución
+    with DealStore() as store:
+        dispatcher = NotificationDispatcher.from_config(config, store)
+        result = None
+        try:
+            result = _run_with_store(config, store, dispatcher=dispatcher)
+            return result
+        finally:
+            # Una ejecución completa ya hizo flush; sólo se repite si terminó antes de llegar ahí
+            dispatcher.close(config["system"].get("notification_flush_timeout", 30), flush=result is None)
+            _run_maintenance(config, store)
+
+def _run_maintenance(config, store: DealStore, force: bool = False):
+    """
+    Retención de price_history: resume y borra muestras viejas, ANALYZE y VACUUM.
+    Sin `force` sólo corre cada `maintenance_interval_days` (y nunca con la retención deshabilitada).
+    """
+    config_sys = config["system"]
+    raw_days = config_sys.get("retention_raw_days", 180)
+    if raw_days:
+        # El horizonte nunca debe recortar la ventana del baseline
+        raw_days = max(int(raw_days), config["scoring"]["baseline_days"])
+    elif not force:
+        # Sin retención no hay mantenimiento automático; --compact igual corre ANALYZE/VACUUM
+        return None
+    granularity = config_sys.get("retention_granularity", "week")
+    try:
+        if force:
+            return store.compact(raw_days, granularity)
+        return store.compact_if_due(raw_days, granularity, config_sys.get("maintenance_interval_days", 7))
+    except (ValueError, sqlite3.Error) as e:
+        logger.error(f"Error en mantenimiento de la base de datos: {e}")
+        return None
+
+def _build_client(config, store: DealStore):
     amadeus_id = os.getenv("AMADEUS_CLIENT_ID")
     amadeus_secret = os.getenv("AMADEUS_CLIENT_SECRET")
     
@@ -47,34 +97,128 @@ def run():
         if not amadeus_id:
             logger.warning("Modo MOCK habilitado: Ejecutando sin credenciales reales.")
 
-    client = AmadeusClient(amadeus_id, amadeus_secret, config)
+    return AmadeusClient(amadeus_id, amadeus_secret, config, store=store)
 
-    scorer = DealScorer(config, store)
-    notifier = WhatsAppNotifier(config)
+def _run_with_store(config, store: DealStore, client: AmadeusClient = None, watches=None, notifiers=None,
+                    dispatcher: NotificationDispatcher = None):
+    """
+    Una ejecución completa. En modo daemon `client`, `notifiers` y `dispatcher` se reutilizan
+    entre iteraciones y `watches` limita la ejecución a los watches que tocan.
+    Al terminar (también si falla) escribe el reporte JSON de tiempos y contadores.
+    """
+    config_sys = config["system"]
+    metrics = instrumentation.start_run()
+    profiler = instrumentation.Profiler(cpu=config_sys.get("profile_cpu", False),
+                                        memory=config_sys.get("profile_memory", False),
+                                        cpu_path=CPU_PROFILE_FILE)
+    result = None
+    try:
+        with profiler:
+            result = _execute_run(config, store, client, watches, notifiers, dispatcher)
+        return result
+    finally:
+        report = metrics.report()
+        report.update(profiler.result)
+        report["completed"] = result is not None
+        if result is not None:
+            report["notifications_sent"] = result["notifications_sent"]
+            report["watches"] = len(result["watches"])
+            result["metrics"] = report
+        instrumentation.log_summary(report)
+        report_path = config_sys.get("run_report_path", RUN_REPORT_FILE)
+        if report_path:
+            instrumentation.write_report(report_path, report)
 
-    # 3. Datos de Viaje
-    origin_country = config["travel"]["origin_country"]
-    dest_country = config["travel"]["destination_country"]
-    airports_limit = config["travel"]["destination_airports_limit"]
+def _execute_run(config, store: DealStore, client: AmadeusClient = None, watches=None, notifiers=None,
+                 dispatcher: NotificationDispatcher = None):
+    """Cuerpo de la ejecución (aeropuertos, búsqueda, watches, notificaciones) sin instrumentación."""
+    # Un solo cliente (token, sesión, rate limiter, cache) para todos los watches
+    if client is None:
+        client = _build_client(config, store)
+        if client is None:
+            return
+
+    # 3. Datos de Viaje: lista de watches (o la sección `travel` como watch único)
+    if watches is None:
+        watches = load_watches(config)
+    if notifiers is None:
+        notifiers = {}
+    if dispatcher is None:
+        dispatcher = NotificationDispatcher.from_config(config, store)
 
-    logger.info(" Iniciando ejecución del Monitor de Vuelos...")
+    logger.info(f" Iniciando ejecución del Monitor de Vuelos ({len(watches)} watches)...")
 
     # 4. Resolver Aeropuertos
-    # Resolver ambos para tener códigos concretos si es necesario, 
-    # pero el user code usa Country code origin directo normalmente.
-    # Solo resolvemos destino según reglas.
-    dest_airports = client.get_top_airports(dest_country, airports_limit)
-    if not dest_airports:
+    # El origen se usa tal cual (código de país/ciudad); sólo resolvemos destino según reglas.
+    active = []
+    with instrumentation.stage("airports"):
+        for watch in watches:
+            dest_airports = client.get_top_airports(watch.destination, watch.destination_airports_limit)
+            if not dest_airports:
+                logger.error(f"[{watch.name}] No se pudieron resolver aeropuertos destino. Se omite.")
+                continue
+            active.append((watch, dest_airports))
+
+    if not active:
         logger.error("No se pudieron resolver aeropuertos destino. Abortando.")
         return
 
-    # 5. Buscar Vuelos
-    # Tequila Client maneja la iteración o batch query
-    deals = client.search_flights(origin_country, dest_airports)
+    # 5. Buscar Vuelos: todas las consultas de todos los watches en una sola cola global
+    jobs = [(watch.origin, dest_airports, watch.config) for watch, dest_airports in active]
+    with instrumentation.stage("search"):
+        deals_by_watch = client.search_many(jobs)
+    instrumentation.incr("offers", sum(len(deals) for deals in deals_by_watch))
+
+    # Resultados y notificaciones separados por watch
+    summaries = {}
+    for (watch, _), deals in zip(active, deals_by_watch):
+        if watch.name not in notifiers:
+            notifiers[watch.name] = WhatsAppNotifier(watch.config)
+        summaries[watch.name] = _process_watch(watch, deals, store, notifiers[watch.name], dispatcher)
+
+    cache_stats = client.response_cache.stats() if client.response_cache else None
+    if cache_stats:
+        logger.info(f"Cache de respuestas: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+
+    # Las alertas se entregan en segundo plano; esperamos con plazo antes de cerrar la ejecución
+    with instrumentation.stage("notify"):
+        dispatcher.flush(config["system"].get("notification_flush_timeout", 30))
+    log_connection_stats()
+
+    found_deals = [deal for summary in summaries.values() for deal in summary["deals"]]
+    alternatives = [s["best_alternative"] for s in summaries.values() if s["best_alternative"]]
+    notifications_sent = sum(summary["notifications_sent"] for summary in summaries.values())
+
+    logger.info(f"Ejecución finalizada. Notificaciones enviadas: {notifications_sent}")
     
+    return {
+        "notifications_sent": notifications_sent,
+        "deals": found_deals,
+        "best_alternative": min(alternatives, key=lambda d: d.price) if alternatives else None,
+        "cache_stats": cache_stats,
+        "http_stats": connection_stats(),
+        "watches": summaries
+    }
+
+def _process_watch(watch: Watch, deals, store: DealStore, notifier: WhatsAppNotifier,
+                   dispatcher: NotificationDispatcher):
+    """
+    Historial, scoring y notificaciones de un watch con su propia config.
+    """
+    config = watch.config
+    scorer = DealScorer(config, store)
+
+    summary = {"notifications_sent": 0, "deals": [], "best_alternative": None}
     if not deals:
-        logger.info("No se encontraron vuelos en esta búsqueda.")
-        return
+        logger.info(f"[{watch.name}] No se encontraron vuelos en esta búsqueda.")
+        return summary
+
+    # Consultas solapadas devuelven ofertas idénticas: se descartan antes de muestrear y evaluar
+    with instrumentation.stage("dedupe"):
+        unique = unique_offers(deals)
+    if len(unique) < len(deals):
+        logger.info(f"[{watch.name}] {len(deals) - len(unique)} ofertas duplicadas descartadas.")
+    deals = unique
 
     # 6. Procesar Resultados para Historial (Sampling)
     # Agrupamos por Ruta + Mes para sacar el precio representativo (mínimo) de hoy
@@ -82,12 +226,10 @@ def run():
     min_prices_map = defaultdict(float) # Key: (route, month) -> min_price
     
     for deal in deals:
-        price = deal.get("price")
-        city_from = deal.get("cityCodeFrom")
-        city_to = deal.get("cityCodeTo")
-        route = f"{city_from}-{city_to}"
+        price = deal.price
+        route = deal.route
         
-        d_time = deal.get("dTime")
+        d_time = deal.d_time
         if not d_time or not price:
             continue
             
@@ -98,19 +240,20 @@ def run():
         if key not in min_prices_map or price < min_prices_map[key]:
             min_prices_map[key] = price
 
-    # Guardar muestras en DB
-    logger.info(f"Guardando {len(min_prices_map)} muestras de precio base (mínimos).")
-    for (route, month_key), price in min_prices_map.items():
-        # Reconstruimos una fecha aproximada (primer día del mes) para la API del store
-        # aunque store toma la fecha real, internally format to month.
-        # Usamos la fecha actual para 'add_price_sample' timestamp si queremos,
-        # pero store.add_price_sample pide 'travel_date'.
-        # Parseamos month_key
-        dt = datetime.strptime(month_key, "%Y-%m")
-        store.add_price_sample(route, dt, price, config["budget"]["currency"])
+    # Guardar muestras en DB (una sola transacción para todo el lote)
+    logger.info(f"[{watch.name}] Guardando {len(min_prices_map)} muestras de precio base (mínimos).")
+    currency = config["budget"]["currency"]
+    # store toma la fecha de viaje y la formatea internamente a mes,
+    # así que reconstruimos el primer día del mes a partir de month_key.
+    samples = (
+        (route, datetime.strptime(month_key, "%Y-%m"), price, currency)
+        for (route, month_key), price in min_prices_map.items()
+    )
+    with instrumentation.stage("ingest"):
+        store.add_price_samples(samples)
 
     # 7. Evaluar Ofertas Individuales (Scoring & Notificación)
-    logger.info("Evaluando ofertas...")
+    logger.info(f"[{watch.name}] Evaluando ofertas...")
     notifications_sent = 0
     found_deals = []
     
@@ -118,24 +261,44 @@ def run():
     best_alternative = None
     
     # Ordenamos deals por precio para evaluar los mejores primero
-    deals.sort(key=lambda x: x.get("price", float('inf')))
+    deals.sort(key=lambda x: x.price)
 
-    for deal in deals:
+    # Scoring por lotes: un solo acceso a baselines para todas las ofertas
+    with instrumentation.stage("scoring"):
+        results = scorer.evaluate_deals(deals)
+
+    # Dedupe contra un índice en memoria: una sola consulta para todos los candidatos.
+    # La llave incluye el watch: dos watches que ven el mismo itinerario notifican por separado.
+    # Mientras existan registros con llaves anteriores (md5 v1, fingerprint v2 sin watch)
+    # también se buscan por esas llaves.
+    candidates = [(deal, result) for deal, result in zip(deals, results) if result.is_deal]
+    with instrumentation.stage("dedupe"):
+        dedupe_keys = {result.deal_hash: store.dedupe_key(watch.name, result.deal_hash) for _, result in candidates}
+        legacy_hashes = {}
+        versions = store.legacy_hash_versions() if candidates else set()
+        if 2 in versions:
+            legacy_hashes[2] = {dedupe_keys[r.deal_hash]: r.deal_hash for _, r in candidates}
+        if 1 in versions:
+            legacy_hashes[1] = {dedupe_keys[r.deal_hash]: scorer.legacy_hash(deal) for deal, r in candidates}
+        notified = store.get_last_notifications(dedupe_keys.values(), legacy_hashes)
+    drop_pct = config["scoring"]["dedupe_drop_pct"]
+    to_notify = []
+
+    for deal, result in zip(deals, results):
         # Track global best
-        if best_alternative is None or deal["price"] < best_alternative["price"]:
+        if best_alternative is None or deal.price < best_alternative.price:
             best_alternative = deal
             
-        result = scorer.evaluate_deal(deal)
         
         if result.is_deal:
             # Chequear deduplicación
-            last_notif = store.get_last_notification(result.deal_hash)
+            dedupe_key = dedupe_keys[result.deal_hash]
+            last_notif = notified.get(dedupe_key)
             should_notify = True
             
             if last_notif:
                 last_price = last_notif["last_price"]
-                current_price = deal["price"]
-                drop_pct = config["scoring"]["dedupe_drop_pct"]
+                current_price = deal.price
                 
                 # Solo notificar de nuevo si el precio bajó X% extra
                 # Logic: last_price * (1 - drop) >= current_price
@@ -144,42 +307,170 @@ def run():
                     logger.info(f"Deal {result.deal_hash} ignorado (Ya notificado y no bajó suficiente).")
 
             if should_notify:
-                logger.info(f"!!! DEAL ENCONTRADO !!! {deal['cityCodeTo']} por {deal['price']} (Conf: {result.confidence})")
-                logger.info(f"Link: {deal.get('deep_link', 'N/A')}")
-                notifier.send_deal_alert(deal, result)
-                store.record_notification(result.deal_hash, deal["price"])
-                notifications_sent += 1
+                logger.info(f"[{watch.name}] !!! DEAL ENCONTRADO !!! {deal.city_to} por {deal.price} (Conf: {result.confidence})")
+                logger.info(f"Link: {deal.deep_link}")
+                # El índice refleja la notificación de inmediato (mismo hash repetido en la ejecución)
+                notified[dedupe_key] = {"last_price": deal.price, "last_notified_at": None}
+                to_notify.append((deal, result))
                 found_deals.append(deal)
         else:
             # Logging verbose o para debug
             pass
 
+    # Outbox + registros de dedupe en una sola transacción; la entrega corre en el dispatcher
+    with instrumentation.stage("notify"):
+        # Las alertas que ya estaban en el outbox (misma llave de idempotencia) no cuentan
+        notifications_sent = dispatcher.enqueue_alerts(notifier, to_notify, dedupe_keys)
+
     # Siempre mostrar la mejor alternativa en consola si existe
     if best_alternative:
-        logger.info(f"🔎 Mejor opción encontrada: {best_alternative.get('cityCodeTo')} - ${best_alternative.get('price')}")
-        logger.info(f"🔗 Google Flights: {best_alternative.get('deep_link', 'N/A')}")
-        logger.info(f"✈️ Skyscanner:    {best_alternative.get('backup_link', 'N/A')}")
+        logger.info(f"[{watch.name}] 🔎 Mejor opción encontrada: {best_alternative.city_to} - ${best_alternative.price}")
+        logger.info(f"🔗 Google Flights: {best_alternative.deep_link}")
+        logger.info(f"✈️ Skyscanner:    {best_alternative.backup_link}")
 
     # 8. Reporte de Ejecución (Si no hubo ofertas)
     if notifications_sent == 0 and config["system"].get("send_summary_if_no_deals", True):
-        logger.info("No se encontraron ofertas. Enviando resumen de ejecución...")
+        logger.info(f"[{watch.name}] No se encontraron ofertas. Enviando resumen de ejecución...")
         stats = {
             "routes_checked": len(min_prices_map), # Approx routes checked
             "best_deal": best_alternative
         }  
-        notifier.send_summary(stats)
+        with instrumentation.stage("notify"):
+            dispatcher.enqueue_summary(notifier, stats)
 
-    logger.info(f"Ejecución finalizada. Notificaciones enviadas: {notifications_sent}")
-    
-    return {
-        "notifications_sent": notifications_sent,
-        "deals": found_deals,
-        "best_alternative": best_alternative
-    }
+    summary.update(notifications_sent=notifications_sent, deals=found_deals, best_alternative=best_alternative)
+    return summary
+
+def run_daemon(config_path: str = "config.yaml", stop_event: threading.Event = None):
+    """
+    Modo daemon: un solo proceso que ejecuta cada watch según su `schedule` (intervalo o cron).
+    Cliente Amadeus (y su token), DealStore y notificadores se mantienen vivos entre iteraciones.
+    La config se recarga cuando cambia el archivo. Las ejecuciones nunca se solapan: si una tarda
+    más que el intervalo, las ejecuciones vencidas se agrupan en la siguiente.
+    """
+    load_dotenv()
+    stop_event = stop_event or threading.Event()
+    poll_seconds = 30 # Cada cuánto revisar cambios de config mientras se espera
+
+    with DealStore() as store:
+        dispatcher = None
+        config = None
+        config_mtime = None
+        client = None
+        notifiers = {}
+        watches = {}
+        schedules = {}
+        next_runs = {}
+
+        while not stop_event.is_set():
+            # Recargar config si cambió (o en la primera iteración)
+            try:
+                mtime = os.path.getmtime(config_path)
+            except OSError as e:
+                logger.error(f"No se puede leer la config ({config_path}): {e}")
+                mtime = config_mtime
+            if mtime != config_mtime:
+                try:
+                    new_config = load_config(config_path)
+                    new_watches = {w.name: w for w in load_watches(new_config)}
+                    new_schedules = {
+                        name: parse_schedule(w.schedule if w.schedule is not None else "every 60m")
+                        for name, w in new_watches.items()
+                    }
+                except (OSError, yaml.YAMLError, KeyError, ValueError) as e:
+                    logger.error(f"Config inválida, se conserva la anterior: {e}")
+                else:
+                    # Rate limiter, cache y credenciales dependen de `system`: sólo entonces se recrea el cliente
+                    if client is None or new_config.get("system") != config.get("system"):
+                        client = _build_client(new_config, store)
+                        if dispatcher:
+                            dispatcher.close(config["system"].get("notification_flush_timeout", 30))
+                        dispatcher = NotificationDispatcher.from_config(new_config, store)
+                    else:
+                        client.config = new_config
+                    if config is not None:
+                        logger.info("Config recargada.")
+                    config = new_config
+                    watches = new_watches
+                    schedules = new_schedules
+                    notifiers = {}
+                    now = datetime.now()
+                    # Watches nuevos corren de inmediato; los existentes conservan su próxima ejecución
+                    next_runs = {name: next_runs.get(name, now) for name in watches}
+                config_mtime = mtime
+
+            if client is None:
+                # Sin credenciales no hay nada que hacer hasta que cambie la config o el entorno
+                stop_event.wait(poll_seconds)
+                continue
+
+            due = due_names(next_runs, datetime.now())
+            if due:
+                logger.info(f"Daemon: ejecutando {', '.join(due)}")
+                try:
+                    _run_with_store(config, store, client=client, watches=[watches[name] for name in due],
+                                    notifiers=notifiers, dispatcher=dispatcher)
+                except Exception:
+                    logger.exception("Error en la iteración del daemon; se reintenta en la próxima ejecución.")
+                # La próxima ejecución se calcula desde el fin de la actual: no hay solapamiento
+                finished = datetime.now()
+                for name in due:
+                    next_runs[name] = schedules[name].next_after(finished)
+                _run_maintenance(config, store)
+                upcoming = min(next_runs.values())
+                logger.info(f"Daemon: próxima ejecución {upcoming.strftime('%Y-%m-%d %H:%M:%S')}")
+
+            if next_runs:
+                wait_seconds = (min(next_runs.values()) - datetime.now()).total_seconds()
+                stop_event.wait(max(0.0, min(wait_seconds, poll_seconds)))
+            else:
+                stop_event.wait(poll_seconds)
+
+        if dispatcher:
+            dispatcher.close(config["system"].get("notification_flush_timeout", 30))
+
+    logger.info("Daemon detenido.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor de ofertas de vuelos")
+    parser.add_argument("--config", default="config.yaml", help="Ruta del archivo de configuración")
+    parser.add_argument("--daemon", action="store_true", help="Ejecutar continuamente según `schedule`")
+    parser.add_argument("--profile", action="store_true",
+                        help="Capturar cProfile y tracemalloc de la ejecución (ver flight_monitor_report.json)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compactar la base de datos (retención, ANALYZE, VACUUM) y salir")
+    args = parser.parse_args()
+
+    if args.compact:
+        config = load_config(args.config)
+        with DealStore() as store:
+            summary = _run_maintenance(config, store, force=True)
+        if summary:
+            if summary["raw_days"] is None:
+                print("Retención deshabilitada (retention_raw_days: 0): no se borraron muestras; sólo ANALYZE/VACUUM.")
+            else:
+                print(f"Muestras resumidas y borradas: {summary['samples_deleted']} "
+                      f"(horizonte {summary['raw_days']} días)")
+            print(f"Tamaño: {summary['bytes_before'] / 1e6:.1f} MB -> {summary['bytes_after'] / 1e6:.1f} MB")
+        return
+
+    if not args.daemon:
+        run(args.config, profile=args.profile)
+        return
+
+    stop_event = threading.Event()
+
+    def _handle_stop(signum, frame):
+        logger.info(f"Señal {signum} recibida: deteniendo el daemon al terminar la iteración actual...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _handle_stop)
+    signal.signal(signal.SIGINT, _handle_stop)
+    run_daemon(args.config, stop_event)
 
 if __name__ == "__main__":
     try:
-        run()
+        main()
     except Exception as e:
         logger.exception("Error crítico en la ejecución del script.")
         exit(1)
@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import instrumentation
+from offers import FlightOffer
+
+logger = logging.getLogger(__name__)
+
+
+def parse_iso_timestamp(value: str, memo: Optional[Dict[str, int]] = None) -> int:
+    """
+    Timestamp (hora local, como strptime().timestamp()) de 'YYYY-MM-DDTHH:MM:SS'.
+    Formato fijo por cortes de string en lugar de strptime; `memo` evita reparsear
+    las fechas repetidas de una misma ejecución. Otros formatos ISO usan fromisoformat.
+    """
+    if memo is not None:
+        cached = memo.get(value)
+        if cached is not None:
+            return cached
+
+    if len(value) == 19 and value[4] == "-" and value[7] == "-" and value[10] == "T":
+        moment = datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                          int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    else:
+        moment = datetime.fromisoformat(value)
+    timestamp = int(moment.timestamp())
+
+    if memo is not None:
+        memo[value] = timestamp
+    return timestamp
+
+
+def normalize_offer(offer: Dict, memo: Optional[Dict[str, int]] = None) -> Optional[FlightOffer]:
+    """
+    Normaliza una sola oferta de Amadeus (completa o reducida con AmadeusClient._slim_offer).
+    Función de módulo (picklable) para poder correr en un pool de procesos.
+    """
+    try:
+        # 1. Precio
+        price = float(offer['price']['total'])
+
+        # 2. Itinerarios
+        itineraries = offer['itineraries']
+        if not itineraries:
+            return None
+
+        # Ida
+        outbound = itineraries[0]['segments']
+        # Vuelta (si existe)
+        inbound = itineraries[1]['segments'] if len(itineraries) > 1 else []
+
+        first_seg = outbound[0]
+        last_seg = outbound[-1]
+
+        # Timestamp salida ("2024-12-01T10:00:00")
+        d_time_ts = parse_iso_timestamp(first_seg['departure']['at'], memo)
+
+        # Timestamp regreso - approx usando primer seg de vuelta
+        # scoring.py no usa aTime críticamente más que para logs/info y links
+        a_time_ts = parse_iso_timestamp(inbound[0]['departure']['at'], memo) if inbound else 0
+
+        # 3. Datos Ruta
+        origin_code = first_seg['departure']['iataCode']
+        dest_code = last_seg['arrival']['iataCode']
+
+        # 4. Aerolíneas (sin duplicados, en orden de aparición: determinista entre procesos)
+        val_airlines = offer.get('validatingAirlineCodes', [])
+        if val_airlines:
+            airlines = list(dict.fromkeys(val_airlines))
+        else:
+            # Fallback a segmentos
+            airlines = list(dict.fromkeys(s['carrierCode'] for s in outbound))
+
+        # 5. Segmentos: scoring y notificaciones sólo usan el conteo (ida + vuelta).
+        # Los links se generan bajo demanda en FlightOffer.
+        return FlightOffer(
+            price=price,
+            city_from=origin_code,
+            city_to=dest_code,
+            d_time=d_time_ts,
+            a_time=a_time_ts,
+            segment_count=len(outbound) + len(inbound),
+            airlines=airlines,
+            source="amadeus"
+        )
+
+    except (KeyError, ValueError, IndexError, TypeError) as e:
+        logger.warning(f"Error parseando oferta Amadeus: {e}")
+        return None
+
+
+def normalize_offers(offers: List[Dict], memo: Optional[Dict[str, int]] = None) -> List[FlightOffer]:
+    """
+    Convierte ofertas de Amadeus a FlightOffer (formato compacto consumido por scoring.py).
+    """
+    if memo is None:
+        memo = {}
+    normalized = []
+    for offer in offers:
+        deal = normalize_offer(offer, memo)
+        if deal is not None:
+            normalized.append(deal)
+    return normalized
+
+
+class NormalizationPool:
+    """
+    Etapa de normalización separada de la red: los hilos de búsqueda entregan las ofertas
+    crudas y siguen con la siguiente petición mientras un pool de hilos las normaliza.
+    Los lotes de al menos `process_threshold` ofertas van a un pool de procesos (0 = nunca).
+    El memo de fechas se comparte entre los hilos durante toda la ejecución.
+    """
+
+    def __init__(self, workers: int = 2, process_threshold: int = 0, process_workers: Optional[int] = None):
+        self.workers = max(0, int(workers))
+        self.process_threshold = max(0, int(process_threshold))
+        self.process_workers = process_workers or os.cpu_count() or 2
+        self._memo: Dict[str, int] = {}
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_config(cls, config_sys: Dict[str, Any]) -> "NormalizationPool":
+        return cls(
+            workers=config_sys.get("normalization_workers", 2),
+            process_threshold=config_sys.get("normalization_process_threshold", 0),
+            process_workers=config_sys.get("normalization_process_workers"),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, offers: List[Dict]) -> Future:
+        """Encola un lote de ofertas crudas; el Future resuelve a List[FlightOffer]."""
+        if self.process_threshold and len(offers) >= self.process_threshold:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+            # Las métricas del proceso hijo no vuelven: se mide desde el envío hasta el resultado
+            submitted = time.perf_counter()
+            future = self._processes.submit(normalize_offers, offers)
+            future.add_done_callback(
+                lambda _: instrumentation.current().add_stage("normalize", time.perf_counter() - submitted))
+            return future
+
+        if self.workers == 0:
+            # Sin pool: normalización en el hilo que llama
+            future = Future()
+            future.set_result(self._normalize(offers))
+            return future
+
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="normalize")
+        return self._threads.submit(self._normalize, offers)
+
+    def _normalize(self, offers: List[Dict]) -> List[FlightOffer]:
+        with instrumentation.stage("normalize"):
+            return normalize_offers(offers, self._memo)
+
+    def close(self):
+        if self._threads:
+            self._threads.shutdown(wait=True)
+            self._threads = None
+        if self._processes:
+            self._processes.shutdown(wait=True)
+            self._processes = None
@@ -0,0 +1,293 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import requests
+
+import instrumentation
+from notifier_whatsapp import WhatsAppNotifier
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Errores de Twilio que vale la pena reintentar (el resto, p.ej. 400 número inválido, no cambia)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class NotificationDispatcher:
+    """
+    Entrega de notificaciones en segundo plano a partir del outbox de DealStore.
+    El loop de scoring sólo escribe en el outbox (junto con el registro de deduplicación, en la
+    misma transacción); un hilo worker lo drena: agrupa lo que llega dentro de una ventana corta,
+    respeta un rate limit por destinatario, reintenta con backoff hasta `max_retries` y, si un
+    destinatario tiene más de `digest_threshold` ofertas en el lote, las envía en un solo resumen.
+    Lo que quede pendiente (plazo vencido, proceso caído) se envía en la siguiente ejecución.
+    La entrega es al menos una vez: si el proceso cae entre la respuesta de Twilio y el
+    registro del envío, el mensaje se reenvía al vencer su lease.
+    """
+
+    def __init__(self, store, config: Dict[str, Any], digest_threshold: int = 3, batch_seconds: float = 2.0,
+                 rate_per_recipient: float = 1.0, max_retries: int = 3, max_backoff: float = 30.0,
+                 lease_seconds: float = 300.0):
+        self.store = store
+        self.config = config
+        self.digest_threshold = int(digest_threshold)
+        self.batch_seconds = float(batch_seconds)
+        self.rate_per_recipient = float(rate_per_recipient)
+        self.max_retries = int(max_retries)
+        self.max_backoff = float(max_backoff)
+        self.lease_seconds = float(lease_seconds)
+
+        self._notifiers: Dict[str, WhatsAppNotifier] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._flush_requested = threading.Event()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        self.sent_count = 0
+        self.failed_count = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], store) -> "NotificationDispatcher":
+        config_sys = config["system"]
+        return cls(
+            store,
+            config,
+            digest_threshold=config_sys.get("notification_digest_threshold", 3),
+            batch_seconds=config_sys.get("notification_batch_seconds", 2.0),
+            rate_per_recipient=config_sys.get("notification_rate_per_second", 1.0),
+            max_retries=config_sys.get("notification_max_retries", 3),
+        )
+
+    def start(self):
+        """Arranca el worker; lo pendiente de ejecuciones anteriores se drena de inmediato."""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self._worker.start()
+        self._wake.set()
+
+    def _register(self, notifier: WhatsAppNotifier):
+        self._notifiers[notifier.to_number] = notifier
+
+    def _notifier_for(self, recipient: str) -> WhatsAppNotifier:
+        notifier = self._notifiers.get(recipient)
+        if notifier is None:
+            # Mensaje de una ejecución anterior para un destinatario que hoy no tiene watch
+            config = {**self.config, "system": {**self.config["system"], "recipient_phone": recipient}}
+            notifier = WhatsAppNotifier(config)
+            self._register(notifier)
+        return notifier
+
+    def enqueue_alerts(self, notifier: WhatsAppNotifier, alerts, dedupe_keys: Optional[Dict[str, str]] = None) -> int:
+        """
+        Escribe en el outbox todas las alertas [(deal, evaluation)] de un watch y sus registros de
+        deduplicación en una sola transacción. No bloquea. Retorna cuántas se encolaron.
+        `dedupe_keys` ({deal_hash: llave}) registra cada deal con la llave de su watch (DealStore.dedupe_key).
+        """
+        self._register(notifier)
+        dedupe_keys = dedupe_keys or {}
+        entries = []
+        for deal, evaluation in alerts:
+            key = dedupe_keys.get(evaluation.deal_hash, evaluation.deal_hash)
+            entries.append({
+                "idempotency_key": f"alert:{notifier.to_number}:{key}:{deal.price:.2f}",
+                "kind": "alert",
+                "recipient": notifier.to_number,
+                "body": notifier.format_deal_alert(deal, evaluation),
+                "digest_line": notifier.format_digest_line(deal, evaluation),
+                "context_tag": deal.city_to,
+                "deal_hash": key,
+                "price": deal.price,
+            })
+        queued = self.store.enqueue_notifications(entries)
+        if entries:
+            self._notify_worker()
+        return queued
+
+    def enqueue_summary(self, notifier: WhatsAppNotifier, stats: Dict[str, Any]) -> bool:
+        """Escribe el resumen de ejecución en el outbox. No bloquea."""
+        self._register(notifier)
+        key = f"summary:{notifier.to_number}:{uuid.uuid4().hex}"
+        queued = self.store.enqueue_notification(key, "summary", notifier.to_number,
+                                                 notifier.format_summary(stats), context_tag="Resumen")
+        self._notify_worker()
+        return queued
+
+    def _notify_worker(self):
+        self.start()
+        self._wake.set()
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """
+        Espera a que el outbox quede vacío, como máximo `timeout` segundos.
+        No espera por mensajes cuyo próximo reintento cae después del plazo.
+        Retorna False si quedaron mensajes pendientes (se reintentan en la próxima ejecución).
+        """
+        deadline = time.monotonic() + timeout
+        wall_deadline = time.time() + timeout
+        self._flush_requested.set()
+        self._notify_worker()
+        try:
+            while True:
+                if self._idle.is_set() and not self._wake.is_set():
+                    pending = self.store.count_pending_notifications()
+                    if pending == 0:
+                        return True
+                    next_due = self.store.next_notification_due()
+                    if next_due is not None and next_due > wall_deadline:
+                        logger.warning(f"{pending} mensajes quedan en el outbox con reintento programado "
+                                       f"después del plazo; se envían en la próxima ejecución.")
+                        return False
+                if time.monotonic() >= deadline:
+                    pending = self.store.count_pending_notifications()
+                    logger.warning(f"Flush de notificaciones vencido: {pending} mensajes quedan en el outbox.")
+                    return False
+                self._wake.set()
+                time.sleep(0.05)
+        finally:
+            self._flush_requested.clear()
+
+    def close(self, timeout: float = 30.0, flush: bool = True) -> bool:
+        """
+        Flush con plazo (salvo `flush=False`, si el llamador ya lo hizo) y detiene el worker.
+        Espera a que termine el envío en curso (acotado por los timeouts HTTP) para que el
+        llamador pueda cerrar el store sin perder el registro de un mensaje ya enviado.
+        """
+        delivered = self.flush(timeout) if flush else True
+        self._stop.set()
+        self._wake.set()
+        if self._worker:
+            self._worker.join()
+            self._worker = None
+        return delivered
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Dormir hasta que llegue algo nuevo o venza el próximo reintento
+            next_due = self.store.next_notification_due()
+            wait = 5.0 if next_due is None else min(5.0, max(0.0, next_due - time.time()))
+            self._wake.wait(wait)
+            if self._stop.is_set():
+                break
+
+            self._idle.clear()
+            self._wake.clear()
+            try:
+                # Ventana corta para juntar las ofertas de la misma ejecución (se corta al pedir flush)
+                window_end = time.monotonic() + self.batch_seconds
+                while time.monotonic() < window_end and not self._flush_requested.is_set() and not self._stop.is_set():
+                    time.sleep(0.05)
+                self._drain()
+            except Exception:
+                logger.exception("Error inesperado entregando notificaciones.")
+            finally:
+                self._idle.set()
+
+    def _drain(self):
+        while not self._stop.is_set():
+            rows = self.store.claim_notifications(lease_seconds=self.lease_seconds)
+            if not rows:
+                return
+            self._dispatch(rows)
+
+    def _dispatch(self, rows: List[Dict[str, Any]]):
+        # Agrupar por destinatario conservando el orden de llegada
+        by_recipient: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_recipient.setdefault(row["recipient"], []).append(row)
+
+        # (notifier, cuerpo, etiqueta, filas del outbox que cubre) por mensaje
+        messages = []
+        for recipient, items in by_recipient.items():
+            notifier = self._notifier_for(recipient)
+            alerts = [row for row in items if row["kind"] == "alert"]
+            if len(alerts) > self.digest_threshold:
+                # Varios mensajes si el digest supera el límite de Twilio; cada uno cubre sus filas
+                digests = notifier.format_digests([row["digest_line"] or row["body"] for row in alerts])
+                start = 0
+                for count, body in digests:
+                    chunk = alerts[start:start + count]
+                    start += count
+                    messages.append((notifier, body, f"Resumen de {len(chunk)} ofertas", chunk))
+            else:
+                messages.extend((notifier, row["body"], row["context_tag"], [row]) for row in alerts)
+
+            messages.extend((notifier, row["body"], row["context_tag"], [row])
+                            for row in items if row["kind"] != "alert")
+
+        for idx, (notifier, body, context_tag, message_rows) in enumerate(messages):
+            if self._stop.is_set():
+                # Cierre en curso: lo no enviado vuelve a 'pending' sin esperar a que venza el lease
+                self.store.release_notifications([row["id"] for *_, rows_left in messages[idx:] for row in rows_left])
+                return
+            self._deliver(notifier, body, context_tag, message_rows)
+
+    def _limiter_for(self, recipient: str) -> RateLimiter:
+        limiter = self._limiters.get(recipient)
+        if limiter is None:
+            limiter = RateLimiter(rate=self.rate_per_recipient, max_retries=self.max_retries,
+                                  max_backoff=self.max_backoff)
+            self._limiters[recipient] = limiter
+        return limiter
+
+    def _deliver(self, notifier: WhatsAppNotifier, body: str, context_tag: str, rows: List[Dict[str, Any]]) -> bool:
+        """
+        Envía un mensaje (que cubre `rows` del outbox) con rate limit por destinatario.
+        Un fallo transitorio reprograma las filas con backoff; uno permanente las marca 'failed'.
+        """
+        ids = [row["id"] for row in rows]
+        attempt = max(row["attempts"] for row in rows)
+        max_attempts = self.max_retries + 1
+
+        if not notifier.can_send:
+            logger.error(f"No se puede enviar ({context_tag}): Faltan credenciales Twilio.")
+            self.store.mark_notifications_failed(ids, "Faltan credenciales Twilio")
+            self.failed_count += len(ids)
+            instrumentation.incr("notifications_failed", len(ids))
+            return False
+
+        limiter = self._limiter_for(notifier.to_number)
+        if not notifier.is_mock:
+            limiter.acquire()
+            if self._stop.is_set():
+                # close() llegó mientras esperábamos turno: no empezar un envío que el store ya no registrará
+                self.store.release_notifications(ids)
+                return False
+        try:
+            notifier.deliver(body, context_tag)
+        except (requests.RequestException, ValueError) as e:
+            response = getattr(e, "response", None)
+            status = response.status_code if response is not None else None
+            if status is not None and status not in RETRYABLE_STATUS:
+                logger.error(f"Error enviando WhatsApp ({context_tag}): {e} (sin reintento)")
+                self.store.mark_notifications_failed(ids, str(e))
+                self.failed_count += len(ids)
+                instrumentation.incr("notifications_failed", len(ids))
+                return False
+
+            if status == 429:
+                delay = limiter.on_throttle(response.headers.get("Retry-After"), attempt)
+            else:
+                delay = limiter.backoff_delay(attempt)
+            self.store.mark_notifications_failed(ids, str(e), retry_in=delay, max_attempts=max_attempts)
+            if attempt + 1 >= max_attempts:
+                logger.error(f"Error enviando WhatsApp ({context_tag}): {e} (reintentos agotados)")
+                self.failed_count += len(ids)
+                instrumentation.incr("notifications_failed", len(ids))
+            else:
+                logger.warning(f"Error enviando WhatsApp ({context_tag}): {e}. "
+                               f"Reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s")
+            return False
+
+        limiter.on_success()
+        self.store.mark_notifications_sent(ids)
+        self.sent_count += len(ids)
+        instrumentation.incr("notifications_delivered", len(ids))
+        return True
@@ -1,7 +1,11 @@
-import requests
 import logging
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
+
+import requests
+
+from http_transport import get_shared_session
+from offers import FlightOffer
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +14,9 @@ class WhatsAppNotifier:
     Envía notificaciones vía WhatsApp usando la API de Twilio (vía HTTP requests).
     """
 
+    # Twilio rechaza (400) cuerpos de más de 1600 caracteres
+    MAX_BODY_CHARS = 1600
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.account_sid = os.getenv("TWILIO_ACCOUNT_SID")
@@ -27,33 +34,49 @@ class WhatsAppNotifier:
             self.to_number = raw_to
         
         self.is_mock = config["system"].get("use_mock_api", False)
+        # Conexión keep-alive a Twilio reutilizada entre mensajes
+        self.session = get_shared_session(config["system"])
         
         if not self.is_mock and not all([self.account_sid, self.auth_token, self.from_number]):
             logger.warning("Credenciales de Twilio no configuradas completamente en .env")
 
-    def send_deal_alert(self, deal: Dict[str, Any], evaluation: Any):
+    @property
+    def can_send(self) -> bool:
+        return self.is_mock or bool(self.account_sid and self.auth_token)
+
+    def send_deal_alert(self, deal: FlightOffer, evaluation: Any):
         """
         Formatea y envía el mensaje de alerta.
         """
-        if not self.is_mock and (not self.account_sid or not self.auth_token):
+        if not self.can_send:
             logger.error("No se puede enviar alerta: Faltan credenciales Twilio.")
             return
 
+        msg_body = self.format_deal_alert(deal, evaluation)
+        
+        if self.is_mock:
+            logger.info(" [MOCK] Simulando envío de WhatsApp:")
+            logger.info(f"\n{msg_body}\n")
+            return
+
+        self._send_twilio_request(msg_body, deal.city_to)
+
+    def format_deal_alert(self, deal: FlightOffer, evaluation: Any) -> str:
         # Calcular porcentaje de descuento
         baseline = evaluation.baseline
-        price = deal.get("price", 0)
+        price = deal.price
         percentage_off = 0.0
         if baseline and baseline > 0:
             percentage_off = ((baseline - price) / baseline) * 100
 
         # Formatear fechas
-        d_time_ts = deal.get("dTime")
+        d_time_ts = deal.d_time
         date_str = datetime.fromtimestamp(d_time_ts).strftime('%d/%m/%Y') if d_time_ts else "N/A"
         
-        segments_count = len(deal.get("route", []))
+        segments_count = deal.segment_count
         
         # Airlines
-        airlines = ", ".join(deal.get("airlines", []))
+        airlines = ", ".join(deal.airlines)
         
         # Flag de confianza
         confidence_marker = ""
@@ -64,29 +87,75 @@ class WhatsAppNotifier:
         msg_body = (
             f"✈️ *NUEVA OFERTA DE VUELO*\n"
             f"{confidence_marker}\n\n"
-            f" Ruta: {deal.get('cityCodeFrom')} -> {deal.get('cityCodeTo')}\n"
+            f" Ruta: {deal.city_from} -> {deal.city_to}\n"
             f" Fecha: {date_str}\n"
             f" Precio: ${price} {self.config.get('budget', {}).get('currency')}\n"
             f" Ahorro: {percentage_off:.1f}% vs Baseline (${baseline:.0f})\n"
             f" Segmentos: {segments_count}\n"
             f" Aerolíneas: {airlines}\n\n"
-            f" Ver Oferta: {deal.get('deep_link')}"
+            f" Ver Oferta: {deal.deep_link}"
         )
-        
-        if self.is_mock:
-            logger.info(" [MOCK] Simulando envío de WhatsApp:")
-            logger.info(f"\n{msg_body}\n")
-            return
+        return msg_body
+
+    def format_digest_line(self, deal: FlightOffer, evaluation: Any) -> str:
+        """Una oferta en una línea, para el mensaje resumen (digest)."""
+        currency = self.config.get('budget', {}).get('currency')
+        date_str = datetime.fromtimestamp(deal.d_time).strftime('%d/%m/%Y') if deal.d_time else "N/A"
+        percentage_off = 0.0
+        if evaluation.baseline and evaluation.baseline > 0:
+            percentage_off = ((evaluation.baseline - deal.price) / evaluation.baseline) * 100
+        return (f"• {deal.city_from} -> {deal.city_to} {date_str}: ${deal.price} {currency} "
+                f"(-{percentage_off:.0f}%)\n  {deal.deep_link}")
 
-        self._send_twilio_request(msg_body, deal.get('cityCodeTo'))
+    def format_digest(self, lines: List[str], part: str = "") -> str:
+        """
+        Un solo mensaje con varias ofertas de la misma ejecución.
+        """
+        return "\n".join([f"✈️ *{len(lines)} NUEVAS OFERTAS DE VUELO*{part}\n"] + list(lines))
+
+    @staticmethod
+    def _body_length(text: str) -> int:
+        # Twilio cuenta unidades UTF-16: un emoji ocupa 2
+        return len(text.encode("utf-16-le")) // 2
+
+    def format_digests(self, lines: List[str]) -> List[Tuple[int, str]]:
+        """
+        Reparte las líneas en digests que respetan MAX_BODY_CHARS, en orden.
+        Retorna (número de líneas, cuerpo) por mensaje; una línea sola demasiado larga se recorta.
+        """
+        # Reservamos el encabezado más largo posible (con " (i/n)"); cada línea suma su largo + salto
+        total = len(lines)
+        header_len = self._body_length(self.format_digest([], f" ({total}/{total})").replace("*0 ", f"*{total} "))
+        budget = self.MAX_BODY_CHARS - header_len
+
+        chunks: List[List[str]] = []
+        used = 0
+        for line in lines:
+            size = self._body_length(line) + 1
+            if size > budget:
+                line = line[:max(0, budget - 2)] + "…"
+                size = self._body_length(line) + 1
+            if not chunks or used + size > budget:
+                chunks.append([])
+                used = 0
+            chunks[-1].append(line)
+            used += size
+
+        if len(chunks) == 1:
+            return [(len(chunks[0]), self.format_digest(chunks[0]))]
+        return [(len(chunk), self.format_digest(chunk, f" ({i}/{len(chunks)})"))
+                for i, chunk in enumerate(chunks, start=1)]
 
     def send_summary(self, stats: Dict[str, Any]):
         """
         Envía un resumen de ejecución cuando no hubo ofertas.
         """
-        if not self.is_mock and (not self.account_sid or not self.auth_token):
+        if not self.can_send:
             return
 
+        self._send_twilio_request(self.format_summary(stats), "Resumen")
+
+    def format_summary(self, stats: Dict[str, Any]) -> str:
         best_deal = stats.get("best_deal")
         routes_count = stats.get("routes_checked", 0)
         
@@ -97,25 +166,40 @@ class WhatsAppNotifier:
         )
         
         if best_deal:
-            d_time_ts = best_deal.get("dTime")
+            d_time_ts = best_deal.d_time
             date_str = datetime.fromtimestamp(d_time_ts).strftime('%d/%m/%Y') if d_time_ts else "N/A"
-            price = best_deal.get("price")
+            price = best_deal.price
             currency = self.config.get('budget', {}).get('currency')
             
             msg_body += (
                 f"📉 *Mejor Alternativa:*\n"
-                f"📍 {best_deal.get('cityCodeTo')} el {date_str}\n"
+                f"📍 {best_deal.city_to} el {date_str}\n"
                 f"💰 ${price} {currency}\n"
-                f"🔗 {best_deal.get('deep_link', '')}\n"
+                f"🔗 {best_deal.deep_link}\n"
             )
         else:
             msg_body += "No se encontró ninguna alternativa válida."
 
-        self._send_twilio_request(msg_body, "Resumen")
+        return msg_body
+
+    def _send_twilio_request(self, body_text: str, context_tag: str) -> bool:
+        """
+        Envía el mensaje registrando (sin propagar) cualquier error. Retorna True si se entregó.
+        """
+        try:
+            self.deliver(body_text, context_tag)
+            return True
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Error enviando WhatsApp ({context_tag}): {e}")
+            if getattr(e, "response", None) is not None:
+                logger.error(f"Twilio respuesta: {e.response.text}")
+            return False
 
-    def _send_twilio_request(self, body_text: str, context_tag: str):
+    def deliver(self, body_text: str, context_tag: str):
         """
-        Helper para enviar la petición a Twilio, soportando Templates si están configurados.
+        Envía la petición a Twilio, soportando Templates si están configurados.
+        Propaga requests.RequestException (HTTPError incluye la respuesta) para que
+        el llamador decida si reintentar.
         """
         if self.is_mock:
             logger.info(f" [MOCK] Simulando envío de WhatsApp ({context_tag}):\n{body_text}\n")
@@ -143,13 +227,8 @@ class WhatsAppNotifier:
             # Mensaje estándar
             data["Body"] = body_text
 
-        try:
-            response = requests.post(url, data=data, auth=(self.account_sid, self.auth_token))
-            response.raise_for_status()
-            logger.info(f"Notificación enviada ({context_tag}). SID: {response.json().get('sid')}")
-        except Exception as e:
-            logger.error(f"Error enviando WhatsApp ({context_tag}): {e}")
-            if 'response' in locals() and response is not None:
-                logger.error(f"Twilio respuesta: {response.text}")
+        response = self.session.post(url, data=data, auth=(self.account_sid, self.auth_token))
+        response.raise_for_status()
+        logger.info(f"Notificación enviada ({context_tag}). SID: {response.json().get('sid')}")
 
 from datetime import datetime
@@ -0,0 +1,105 @@
+import hashlib
+import struct
+import sys
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+# Versión del fingerprint de FlightOffer (1 = md5 de texto formateado, ver DealScorer.legacy_hash)
+FINGERPRINT_VERSION = 2
+
+# d_time, a_time, segmentos, origen y destino en ancho fijo; las aerolíneas van a continuación
+_FINGERPRINT_STRUCT = struct.Struct("<qqH8s8s")
+
+
+class FlightOffer:
+    """
+    Representación compacta de una oferta normalizada.
+    Usa __slots__ (sin __dict__ por instancia) y guarda sólo lo que consumen scoring,
+    store y notificaciones: precio, IATA, timestamps, número de segmentos y aerolíneas internadas.
+    Los links de Google Flights / Skyscanner se construyen bajo demanda.
+    """
+
+    __slots__ = ("price", "city_from", "city_to", "d_time", "a_time",
+                 "segment_count", "airlines", "source", "_deep_link", "_backup_link", "_fingerprint")
+
+    def __init__(self, price: float, city_from: str, city_to: str, d_time: int, a_time: int,
+                 segment_count: int, airlines: Iterable[str], source: str = "amadeus",
+                 deep_link: Optional[str] = None, backup_link: Optional[str] = None):
+        self.price = price
+        self.city_from = sys.intern(city_from)
+        self.city_to = sys.intern(city_to)
+        self.d_time = d_time
+        self.a_time = a_time # 0 si no hay vuelta
+        self.segment_count = segment_count
+        self.airlines: Tuple[str, ...] = tuple(sys.intern(a) for a in airlines)
+        self.source = sys.intern(source)
+        # Links explícitos (p.ej. mock); si son None se generan al pedirlos
+        self._deep_link = deep_link
+        self._backup_link = backup_link
+        self._fingerprint: Optional[str] = None
+
+    @property
+    def route(self) -> str:
+        return f"{self.city_from}-{self.city_to}"
+
+    @property
+    def deep_link(self) -> str:
+        """Link de Google Flights (Query más explícita)."""
+        if self._deep_link is None:
+            dep_date_str = datetime.fromtimestamp(self.d_time).strftime("%Y-%m-%d")
+            # Google Flights: "Flights from ORIGIN to DEST on DATE returning DATE"
+            gf_query = f"Flights from {self.city_from} to {self.city_to} on {dep_date_str}"
+            if self.a_time:
+                ret_str = datetime.fromtimestamp(self.a_time).strftime("%Y-%m-%d")
+                gf_query += f" returning {ret_str}"
+            return f"https://www.google.com/travel/flights?q={gf_query.replace(' ', '+')}"
+        return self._deep_link
+
+    @property
+    def backup_link(self) -> str:
+        """Link de Skyscanner: https://www.skyscanner.com.mx/transport/vuelos/mex/gye/240501/240510"""
+        if self._backup_link is None:
+            # Skyscanner format uses YYMMDD
+            sky_dep = datetime.fromtimestamp(self.d_time).strftime("%y%m%d")
+            sky_ret = datetime.fromtimestamp(self.a_time).strftime("%y%m%d") if self.a_time else ""
+            return (f"https://www.skyscanner.com.mx/transport/vuelos/"
+                    f"{self.city_from.lower()}/{self.city_to.lower()}/{sky_dep}/{sky_ret}")
+        return self._backup_link
+
+    def fingerprint(self) -> str:
+        """
+        Identidad estable del itinerario (ruta, fechas, segmentos, aerolíneas) para deduplicación:
+        BLAKE2b de 16 bytes sobre un struct empaquetado. Se calcula una vez y sólo si se pide.
+        """
+        if self._fingerprint is None:
+            packed = _FINGERPRINT_STRUCT.pack(
+                self.d_time, self.a_time, self.segment_count,
+                self.city_from.encode("ascii", "replace"), self.city_to.encode("ascii", "replace")
+            )
+            airlines = ",".join(self.airlines).encode("ascii", "replace")
+            self._fingerprint = hashlib.blake2b(packed + airlines, digest_size=16).hexdigest()
+        return self._fingerprint
+
+    def _key(self) -> tuple:
+        return (self.price, self.city_from, self.city_to, self.d_time, self.a_time,
+                self.segment_count, self.airlines, self.source, self._deep_link, self._backup_link)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FlightOffer):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return (f"FlightOffer({self.route}, price={self.price}, d_time={self.d_time}, "
+                f"a_time={self.a_time}, segments={self.segment_count}, airlines={list(self.airlines)})")
+
+
+def unique_offers(offers: Iterable[FlightOffer]) -> List[FlightOffer]:
+    """
+    Elimina ofertas idénticas (consultas solapadas devuelven la misma oferta) conservando el orden.
+    Usa el hash de tupla de FlightOffer, más barato que el fingerprint.
+    """
+    return list(dict.fromkeys(offers))
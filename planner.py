@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from math import gcd
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (origen, destino, fecha salida, fecha regreso)
+Query = Tuple[str, str, str, str]
+
+
+class DateSweepPlanner:
+    """
+    Planificador determinista: enumera la malla completa (destino, salida, noches) de la ventana
+    de viaje y la reparte entre ejecuciones con un cursor persistente en el store.
+    Cada ejecución consume `max_queries_per_run` celdas; la cobertura completa se repite cada
+    ceil(celdas / presupuesto) ejecuciones, sin consultar dos veces el mismo par de fechas.
+    """
+
+    STATE_PREFIX = "sweep_cursor"
+
+    def __init__(self, config_dates: Dict[str, Any], store=None, today: Optional[datetime] = None):
+        self.config_dates = config_dates
+        self.store = store
+        self.today = today or datetime.now()
+        # Sin store el cursor sólo vive en memoria (p.ej. en pruebas)
+        self._memory_state: Dict[str, str] = {}
+
+    def date_grid(self) -> List[Tuple[str, str]]:
+        """
+        Todos los pares (salida, regreso) únicos de la ventana de viaje.
+        """
+        start_delta = self.config_dates["travel_window_start"]
+        end_delta = self.config_dates["travel_window_end"]
+        min_nights = self.config_dates["min_nights"]
+        max_nights = self.config_dates["max_nights"]
+
+        pairs = []
+        for day in range(start_delta, end_delta + 1):
+            depart_date = self.today + timedelta(days=day)
+            for nights in range(min_nights, max_nights + 1):
+                return_date = depart_date + timedelta(days=nights)
+                pairs.append((depart_date.strftime("%Y-%m-%d"), return_date.strftime("%Y-%m-%d")))
+        return list(dict.fromkeys(pairs))
+
+    @staticmethod
+    def _spread_order(n: int) -> List[int]:
+        """
+        Permutación determinista de range(n) con paso coprimo ~ n/φ: cualquier tramo
+        consecutivo de la permutación queda repartido a lo largo de toda la malla.
+        """
+        if n <= 2:
+            return list(range(n))
+        stride = max(1, int(n * 0.618))
+        while gcd(stride, n) != 1:
+            stride += 1
+        return [(i * stride) % n for i in range(n)]
+
+    def _state_key(self, origin: str, dest_airports: List[str]) -> str:
+        # La llave cambia si cambia la malla, así un cambio de config reinicia el cursor
+        d = self.config_dates
+        raw = (f"{origin}|{','.join(dest_airports)}|{d['travel_window_start']}|{d['travel_window_end']}"
+               f"|{d['min_nights']}|{d['max_nights']}")
+        return f"{self.STATE_PREFIX}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+    def _load_cursor(self, key: str) -> int:
+        value = self.store.get_state(key) if self.store else self._memory_state.get(key)
+        try:
+            return int(value) if value is not None else 0
+        except ValueError:
+            return 0
+
+    def _save_cursor(self, key: str, cursor: int):
+        if self.store:
+            self.store.set_state(key, str(cursor))
+        else:
+            self._memory_state[key] = str(cursor)
+
+    def plan(self, origin: str, dest_airports: List[str], budget: int) -> List[Query]:
+        """
+        Siguiente tramo de la malla para esta ejecución (a lo sumo `budget` consultas).
+        """
+        dest_airports = list(dict.fromkeys(dest_airports))
+        grid = self.date_grid()
+        cells = [(dest, dep, ret) for dep, ret in grid for dest in dest_airports]
+        if not cells:
+            return []
+
+        order = self._spread_order(len(cells))
+        key = self._state_key(origin, dest_airports)
+        cursor = self._load_cursor(key) % len(cells)
+        count = min(budget, len(cells))
+
+        queries = []
+        for i in range(count):
+            dest, dep, ret = cells[order[(cursor + i) % len(cells)]]
+            queries.append((origin, dest, dep, ret))
+
+        self._save_cursor(key, (cursor + count) % len(cells))
+        runs_per_cycle = -(-len(cells) // max(1, budget))
+        logger.info(f"Sweep: {count} de {len(cells)} celdas (cursor {cursor}); cobertura completa cada {runs_per_cycle} ejecuciones.")
+        return queries
+
+
+class AdaptiveQueryPlanner:
+    """
+    Planificador explore/exploit: reparte el presupuesto de consultas entre celdas (destino, mes)
+    según su valor esperado calculado con price_history:
+    - baseline incompleto (muestras por debajo de `min_samples`) -> llenar cold starts
+    - volatilidad (coeficiente de variación) -> más probabilidad de ofertas reales
+    - tiempo desde la última muestra -> datos viejos
+    - distancia del mínimo reciente al baseline -> caídas de precio en curso
+    Una fracción `explore_ratio` del presupuesto se asigna al azar para no ignorar celdas.
+    """
+
+    DEFAULT_WEIGHTS = {"cold": 1.0, "volatility": 1.0, "staleness": 0.5, "dip": 1.5}
+    # Horas sin muestras a partir de las cuales una celda se considera totalmente vieja
+    STALE_HOURS = 24 * 7
+
+    def __init__(self, config: Dict[str, Any], store=None, today: Optional[datetime] = None, rng=None):
+        self.config_dates = config["dates"]
+        self.config_sys = config["system"]
+        self.scoring_cfg = config["scoring"]
+        self.store = store
+        self.today = today or datetime.now()
+        self.weights = {**self.DEFAULT_WEIGHTS, **self.config_sys.get("planner_weights", {})}
+        self.explore_ratio = float(self.config_sys.get("planner_explore_ratio", 0.2))
+        self.rng = rng or random.Random()
+
+    def _cell_score(self, stats: Optional[Dict], baseline: Optional[float]) -> float:
+        min_samples = max(1, self.scoring_cfg["min_samples"])
+        if not stats:
+            # Celda sin historial: máxima prioridad de cold start y de antigüedad
+            return self.weights["cold"] + self.weights["staleness"]
+
+        cold = max(0, min_samples - stats["count"]) / min_samples
+        volatility = (stats["variance"] ** 0.5) / stats["mean"] if stats["mean"] else 0.0
+
+        staleness = 1.0
+        try:
+            last_at = datetime.strptime(stats["last_recorded_at"], "%Y-%m-%d %H:%M:%S")
+            # recorded_at usa CURRENT_TIMESTAMP de SQLite (UTC)
+            now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+            staleness = min(1.0, (now_utc - last_at).total_seconds() / 3600 / self.STALE_HOURS)
+        except (TypeError, ValueError):
+            pass
+
+        dip = max(0.0, (baseline - stats["min"]) / baseline) if baseline else 0.0
+
+        return (self.weights["cold"] * cold + self.weights["volatility"] * volatility
+                + self.weights["staleness"] * staleness + self.weights["dip"] * dip)
+
+    def plan(self, origin: str, dest_airports: List[str], budget: int) -> List[Query]:
+        """
+        Reparte `budget` consultas entre celdas (destino, mes) y elige fechas dentro de cada mes.
+        """
+        dest_airports = list(dict.fromkeys(dest_airports))
+        grid = DateSweepPlanner(self.config_dates, today=self.today).date_grid()
+
+        # Pares de fechas disponibles por mes de salida
+        pairs_by_month: Dict[str, List[Tuple[str, str]]] = {}
+        for dep, ret in grid:
+            pairs_by_month.setdefault(dep[:7], []).append((dep, ret))
+
+        cells = [(dest, month) for dest in dest_airports for month in pairs_by_month]
+        if not cells or budget <= 0:
+            return []
+
+        # Puntaje por celda a partir del historial.
+        # Nota: las rutas del historial usan el IATA real de salida; si `origin` es un código
+        # de ciudad (p.ej. TYO) las celdas sin coincidencia se tratan como cold start.
+        days_back = self.scoring_cfg["baseline_days"]
+        routes = [f"{origin}-{dest}" for dest in dest_airports]
+        stats = self.store.get_cell_stats(routes, days_back) if self.store else {}
+        baselines = {}
+        if self.store:
+            keys = [(f"{origin}-{dest}", month) for dest, month in cells]
+            # Sólo lectura: no materializar filas vacías de celdas que quizá no se consulten
+            baselines = self.store.get_baseline_stats_many(keys, days_back, materialize=False)
+
+        scores = {}
+        for dest, month in cells:
+            key = (f"{origin}-{dest}", month)
+            scores[(dest, month)] = self._cell_score(stats.get(key), baselines.get(key, (None, 0))[0])
+
+        # Exploit: asignación greedy con rendimientos decrecientes (score / (1 + asignadas))
+        capacity = {cell: len(pairs_by_month[cell[1]]) for cell in cells}
+        allocation = {cell: 0 for cell in cells}
+        explore_budget = int(round(budget * self.explore_ratio))
+        exploit_budget = budget - explore_budget
+
+        for _ in range(exploit_budget):
+            open_cells = [c for c in cells if allocation[c] < capacity[c]]
+            if not open_cells:
+                break
+            best = max(open_cells, key=lambda c: scores[c] / (1 + allocation[c]))
+            allocation[best] += 1
+
+        # Explore: celdas al azar con capacidad disponible
+        for _ in range(explore_budget):
+            open_cells = [c for c in cells if allocation[c] < capacity[c]]
+            if not open_cells:
+                break
+            allocation[self.rng.choice(open_cells)] += 1
+
+        queries = []
+        for (dest, month), count in allocation.items():
+            if count:
+                for dep, ret in self.rng.sample(pairs_by_month[month], count):
+                    queries.append((origin, dest, dep, ret))
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:3]
+        logger.info(f"Planner adaptativo: {len(queries)} consultas en {sum(1 for c in allocation.values() if c)} celdas. "
+                    f"Top: {[(f'{d} {m}', round(sc, 2)) for (d, m), sc in top]}")
+        return queries
@@ -0,0 +1,137 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Límite documentado de Amadeus Self-Service (test): 10 transacciones por segundo
+DEFAULT_MAX_RPS = 10.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Interpreta el header Retry-After (segundos o fecha HTTP). Retorna segundos o None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """
+    Token bucket thread-safe con control adaptativo (AIMD) de la tasa.
+    - Cada petición consume un token; los tokens se reponen a `rate` por segundo.
+    - Un 429 reduce la tasa a la mitad y pausa a todos los hilos (Retry-After o backoff con jitter).
+    - Cada respuesta exitosa sube la tasa poco a poco hasta `max_rate`.
+    """
+
+    def __init__(self, rate: float, max_rate: Optional[float] = None, min_rate: float = 0.2,
+                 burst: float = 1.0, max_retries: int = 4,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.max_rate = float(max_rate or rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = min(max(float(rate), self.min_rate), self.max_rate)
+        self.burst = max(1.0, float(burst))
+        self.max_retries = int(max_retries)
+        self.base_backoff = float(base_backoff)
+        self.max_backoff = float(max_backoff)
+        # Incremento aditivo por éxito: ~20 respuestas OK para recuperar la tasa máxima
+        self.increase_step = self.max_rate / 20.0
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._cooldown_until = 0.0
+
+        self.requests_count = 0
+        self.throttled_count = 0
+
+    @classmethod
+    def from_config(cls, config_sys: Dict[str, Any]) -> "RateLimiter":
+        """
+        Construye el limitador desde la sección `system` del config.
+        `max_requests_per_second` es el techo; `sleep_seconds_between_requests` (legacy) la tasa inicial.
+        """
+        max_rate = float(config_sys.get("max_requests_per_second") or DEFAULT_MAX_RPS)
+        sleep_seconds = float(config_sys.get("sleep_seconds_between_requests") or 0)
+        initial_rate = min(max_rate, 1.0 / sleep_seconds) if sleep_seconds > 0 else max_rate
+        return cls(
+            rate=initial_rate,
+            max_rate=max_rate,
+            burst=config_sys.get("rate_limit_burst", 1),
+            max_retries=config_sys.get("rate_limit_max_retries", 4),
+            max_backoff=config_sys.get("rate_limit_max_backoff", 60),
+        )
+
+    def _refill(self, now: float):
+        if now > self._last_refill:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+
+    def acquire(self) -> float:
+        """
+        Bloquea hasta que haya un token disponible. Retorna los segundos esperados.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            self.requests_count += 1
+            # Si el bucket quedó en deuda, esperamos lo que tarda en reponerse
+            wait = max(0.0, self._last_refill - now)
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+
+        waited = 0.0
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            # Un 429 de otro hilo pudo abrir una pausa global mientras dormíamos
+            with self._lock:
+                wait = self._cooldown_until - time.monotonic()
+        return waited
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Backoff exponencial con jitter (mitad fija, mitad aleatoria)."""
+        cap = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return random.uniform(cap / 2.0, cap)
+
+    def on_throttle(self, retry_after: Optional[str] = None, attempt: int = 0) -> float:
+        """
+        Registra un 429: reduce la tasa y abre una pausa global.
+        Retorna los segundos de pausa aplicados.
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.backoff_delay(attempt)
+
+        with self._lock:
+            self.throttled_count += 1
+            self.rate = max(self.min_rate, self.rate / 2.0)
+            now = time.monotonic()
+            self._cooldown_until = max(self._cooldown_until, now + delay)
+            # Los tokens empiezan a reponerse cuando termina la pausa
+            self._tokens = min(self._tokens, 0.0)
+            self._last_refill = max(self._last_refill, self._cooldown_until)
+
+        logger.warning(f"Rate limit: tasa reducida a {self.rate:.2f} req/s, pausa de {delay:.1f}s.")
+        return delay
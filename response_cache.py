@@ -0,0 +1,151 @@
+import sqlite3
+import json
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Cache persistente (SQLite, un solo archivo) de respuestas de la API de Amadeus.
+    Las entradas expiran por TTL y el tamaño se acota con desalojo LRU.
+    """
+
+    # Un hit sólo actualiza last_access si el último acceso registrado es más viejo que esto
+    TOUCH_INTERVAL_SECONDS = 60
+
+    def __init__(self, db_path: str = "response_cache.db", ttl_seconds: int = 1800, max_entries: int = 5000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Una sola conexión compartida entre hilos, serializada con el lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, config_sys: Dict[str, Any]) -> Optional["ResponseCache"]:
+        """
+        Construye el cache desde la sección `system` del config. Retorna None si está deshabilitado.
+        """
+        if not config_sys.get("use_response_cache", True) or config_sys.get("use_mock_api", False):
+            return None
+        return cls(
+            db_path=config_sys.get("response_cache_path", "response_cache.db"),
+            ttl_seconds=int(config_sys.get("response_cache_ttl_minutes", 30)) * 60,
+            max_entries=int(config_sys.get("response_cache_max_entries", 5000)),
+        )
+
+    def _init_db(self):
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache (last_access)')
+            # Limpiar expirados de ejecuciones anteriores
+            cursor.execute('DELETE FROM response_cache WHERE expires_at < ?', (time.time(),))
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(namespace: str, params: Dict[str, Any]) -> str:
+        """
+        Genera una llave estable a partir de parámetros normalizados
+        (mayúsculas, sin espacios y listas separadas por comas ordenadas).
+        """
+        normalized = {}
+        for name, value in params.items():
+            if isinstance(value, str):
+                parts = [p.strip().upper() for p in value.split(",")]
+                value = ",".join(sorted(parts)) if len(parts) > 1 else parts[0]
+            normalized[name] = value
+        raw = f"{namespace}|{json.dumps(normalized, sort_keys=True)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            try:
+                cursor = self._conn.cursor()
+                cursor.execute('SELECT payload, expires_at, last_access FROM response_cache WHERE cache_key = ?',
+                               (key,))
+                row = cursor.fetchone()
+                hit = row is not None and row[1] >= now
+                if hit:
+                    try:
+                        value = json.loads(row[0])
+                    except ValueError:
+                        # Payload corrupto: cuenta como miss y se borra igual que una entrada expirada
+                        logger.warning("Entrada corrupta en cache de respuestas; se descarta")
+                        hit = False
+                if not hit:
+                    if row is not None:
+                        cursor.execute('DELETE FROM response_cache WHERE cache_key = ?', (key,))
+                        self._conn.commit()
+                    self.misses += 1
+                    instrumentation.incr("cache_misses")
+                    return None
+                # La recencia LRU sólo necesita ser aproximada: evita un UPDATE + commit por hit
+                if now - row[2] >= self.TOUCH_INTERVAL_SECONDS:
+                    cursor.execute('UPDATE response_cache SET last_access = ? WHERE cache_key = ?', (now, key))
+                    self._conn.commit()
+                self.hits += 1
+                instrumentation.incr("cache_hits")
+                return value
+            except sqlite3.Error as e:
+                logger.error(f"Error leyendo cache de respuestas: {e}")
+                self.misses += 1
+                return None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None):
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            try:
+                cursor = self._conn.cursor()
+                cursor.execute('''
+                    INSERT INTO response_cache (cache_key, payload, expires_at, last_access)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(cache_key) DO UPDATE SET
+                        payload = excluded.payload,
+                        expires_at = excluded.expires_at,
+                        last_access = excluded.last_access
+                ''', (key, payload, now + ttl, now))
+                self._evict(cursor)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error guardando en cache de respuestas: {e}")
+
+    def _evict(self, cursor: sqlite3.Cursor):
+        """
+        Desaloja las entradas menos usadas recientemente si se excede `max_entries`.
+        """
+        cursor.execute('SELECT COUNT(*) FROM response_cache')
+        excess = cursor.fetchone()[0] - self.max_entries
+        if excess > 0:
+            cursor.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache ORDER BY last_access LIMIT ?
+                )
+            ''', (excess,))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,132 @@
+import re
+import logging
+from datetime import datetime, timedelta
+from typing import List, Set, Union
+
+logger = logging.getLogger(__name__)
+
+_INTERVAL_RE = re.compile(r"^(?:every\s+)?(\d+)\s*([smhd]?)$", re.IGNORECASE)
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "": 60}
+
+
+class IntervalSchedule:
+    """
+    Intervalo fijo: la siguiente ejecución es `seconds` después del instante dado.
+    """
+
+    def __init__(self, seconds: int):
+        if seconds <= 0:
+            raise ValueError("El intervalo debe ser positivo")
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def __repr__(self) -> str:
+        return f"IntervalSchedule({self.seconds}s)"
+
+
+class CronSchedule:
+    """
+    Expresión cron de 5 campos (minuto hora día-mes mes día-semana).
+    Soporta '*', números, rangos 'a-b', listas 'a,b' y pasos '*/n' o 'a-b/n'.
+    Día de semana: 0-6 con domingo = 0 (7 también es domingo).
+    Como en cron, si día-mes y día-semana están restringidos basta con que coincida uno.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): '{expression}'")
+        self.expression = expression
+        self.minutes = self._parse_field(fields[0], 0, 59)
+        self.hours = self._parse_field(fields[1], 0, 23)
+        self.days = self._parse_field(fields[2], 1, 31)
+        self.months = self._parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in self._parse_field(fields[4], 0, 7)}
+        self._days_any = fields[2] == "*"
+        self._weekdays_any = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"Paso inválido en campo cron: '{field}'")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_str, end_str = part.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Valor fuera de rango en campo cron: '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        dom = moment.day in self.days
+        dow = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._days_any and self._weekdays_any:
+            return True
+        if self._days_any:
+            return dow
+        if self._weekdays_any:
+            return dom
+        return dom or dow
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Primer minuto estrictamente posterior a `moment` que cumple la expresión.
+        Salta meses, días y horas completos que no coinciden en lugar de avanzar minuto a minuto.
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = (candidate.year + 1, 1) if candidate.month == 12 else (candidate.year, candidate.month + 1)
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"La expresión cron '{self.expression}' no tiene próximas ejecuciones")
+
+    def __repr__(self) -> str:
+        return f"CronSchedule('{self.expression}')"
+
+
+Schedule = Union[IntervalSchedule, CronSchedule]
+
+
+def parse_schedule(spec: Union[str, int, float]) -> Schedule:
+    """
+    Convierte la config de `schedule` en un objeto con `next_after(datetime)`.
+    Acepta minutos (número), intervalos ('every 30m', '2h', '90s') o cron de 5 campos ('0 */6 * * *').
+    """
+    if isinstance(spec, (int, float)):
+        return IntervalSchedule(int(spec * 60))
+
+    text = str(spec).strip()
+    match = _INTERVAL_RE.match(text)
+    if match:
+        return IntervalSchedule(int(match.group(1)) * _UNIT_SECONDS[match.group(2).lower()])
+    return CronSchedule(text)
+
+
+def due_names(next_runs: dict, now: datetime) -> List[str]:
+    """Nombres cuya próxima ejecución ya venció, en orden de vencimiento."""
+    return [name for name, when in sorted(next_runs.items(), key=lambda item: item[1]) if when <= now]
@@ -1,9 +1,11 @@
 import logging
 import hashlib
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
+from offers import FlightOffer
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -12,7 +14,7 @@ class EvaluationResult:
     confidence: str # "HIGH", "LOW", "COLD_START"
     baseline: float
     score_details: str # Razón o detalles
-    deal_hash: str
+    deal_hash: str # Fingerprint del itinerario; vacío si no es deal (no se calcula)
 
 class DealScorer:
     """
@@ -26,60 +28,73 @@ class DealScorer:
         self.scoring_cfg = config["scoring"]
         self.budget_max = config["budget"]["max_price"]
 
-    def _generate_hash(self, deal: Dict[str, Any]) -> str:
+    def _generate_hash(self, deal: FlightOffer) -> str:
         """
-        Genera un hash determinístico para deduplicación.
-        Campos: route, dates, airlines, stopovers, link (o subset).
+        Hash determinístico para deduplicación (ver FlightOffer.fingerprint).
         """
-        # Extraer datos clave
-        city_from = deal.get("cityCodeFrom", "")
-        city_to = deal.get("cityCodeTo", "")
-        route_str = f"{city_from}-{city_to}"
-        
-        # Fechas (Unix timestamps o strings ISO)
-        d_time = deal.get("dTime", 0)
-        a_time = deal.get("aTime", 0) # Regreso (depende estructura exacta API, a veces es 'route')
-        # Para round trip en Tequila 'data' root tiene dTime (ida). La vuelta está en 'route'.
-        # Simplificación: Usaremos dTime de ida y dTime de vuelta si disponible, o deep_link.
-        # El deep_link suele ser único por itinerario.
-        link = deal.get("deep_link", "")
-        price = deal.get("price", 0)
-        airlines = ",".join(deal.get("airlines", []))
-        
-        # String base
-        # Nota: Usamos el link como proxy fuerte de unicidad de itinerario, 
-        # pero agregamos precio y fechas para robustez si el link cambia parámetros de sesión.
-        # User req: hash of route + dates + airlines + stopovers + link
-        raw_str = f"{route_str}|{d_time}|{airlines}|{link}"
-        
+        return deal.fingerprint()
+
+    @staticmethod
+    def legacy_hash(deal: FlightOffer) -> str:
+        """
+        Hash de la versión 1 (md5 de route|d_time|airlines|link), sólo para encontrar
+        notificaciones registradas antes del cambio de fingerprint.
+        """
+        raw_str = f"{deal.route}|{deal.d_time}|{','.join(deal.airlines)}|{deal.deep_link}"
         return hashlib.md5(raw_str.encode("utf-8")).hexdigest()
 
-    def evaluate_deal(self, deal: Dict[str, Any]) -> EvaluationResult:
+    def evaluate_deal(self, deal: FlightOffer) -> EvaluationResult:
         """
         Aplica las reglas de negocio para determinar si es un deal.
         """
-        price = deal.get("price", float('inf'))
-        city_from = deal.get("cityCodeFrom", "")
-        city_to = deal.get("cityCodeTo", "")
-        route = f"{city_from}-{city_to}"
-        
+        route, travel_date = self._route_and_date(deal)
+        baseline, count = self.store.get_baseline_stats(route, travel_date, self.scoring_cfg["baseline_days"])
+        return self._classify(deal, baseline, count)
+
+    def evaluate_deals(self, deals: List[FlightOffer]) -> List[EvaluationResult]:
+        """
+        Versión por lotes de evaluate_deal (mismas reglas y resultados, en el orden de entrada).
+        Agrupa por (ruta, mes) y obtiene todos los baselines necesarios en una sola consulta.
+        """
+        if not deals:
+            return []
+
+        # Mes de viaje por timestamp (las ofertas de una misma búsqueda repiten fechas)
+        month_cache: Dict[int, str] = {}
+        keys: List[Tuple[str, str]] = []
+        for deal in deals:
+            d_time_ts = deal.d_time
+            month = month_cache.get(d_time_ts)
+            if month is None:
+                month = datetime.fromtimestamp(d_time_ts).strftime("%Y-%m")
+                month_cache[d_time_ts] = month
+            keys.append((deal.route, month))
+
+        # Las ofertas fuera de presupuesto se rechazan sin consultar baseline
+        needed = {key for deal, key in zip(deals, keys) if deal.price <= self.budget_max}
+        baselines = self.store.get_baseline_stats_many(needed, self.scoring_cfg["baseline_days"])
+        return [self._classify(deal, *baselines.get(key, (None, 0))) for deal, key in zip(deals, keys)]
+
+    def _route_and_date(self, deal: FlightOffer) -> Tuple[str, datetime]:
         # Fecha de viaje para buscar baseline (mes)
-        d_time_ts = deal.get("dTime")
-        travel_date = datetime.fromtimestamp(d_time_ts)
+        return deal.route, datetime.fromtimestamp(deal.d_time)
+
+    def _classify(self, deal: FlightOffer, baseline: Optional[float], count: int) -> EvaluationResult:
+        """
+        Reglas de decisión dado el baseline (mediana) y el número de muestras de la ruta/mes.
+        """
+        price = deal.price
         
-        # Hash para dedupe
-        deal_hash = self._generate_hash(deal)
+        # El hash de dedupe sólo se calcula para los deals (el resto nunca se consulta)
+        deal_hash = ""
 
         # 0. Check Presupuesto Absoluto (Seguridad)
         if price > self.budget_max:
             return EvaluationResult(False, "NONE", 0.0, "Precio excede presupuesto máximo", deal_hash)
 
-        # 1. Obtener Baseline
-        baseline_days = self.scoring_cfg["baseline_days"]
+        # 1. Baseline (obtenido por el llamador)
         min_samples = self.scoring_cfg["min_samples"]
         
-        baseline, count = self.store.get_baseline_stats(route, travel_date, baseline_days)
-        
         # 2. Cold Start Logic
         if count < min_samples:
             # Caso Cold Start
@@ -101,7 +116,8 @@ class DealScorer:
             upper_bound = baseline * (1 - discount_min)
             
             if lower_bound <= price <= upper_bound:
-                return EvaluationResult(True, "COLD_START", baseline, f"Deal en Cold Start (Muestras: {count})", deal_hash)
+                return EvaluationResult(True, "COLD_START", baseline, f"Deal en Cold Start (Muestras: {count})",
+                                        self._generate_hash(deal))
             else:
                 return EvaluationResult(False, "COLD_START", baseline, "Precio fuera de rango relativo (Cold Start)", deal_hash)
 
@@ -113,6 +129,6 @@ class DealScorer:
         upper_bound = baseline * (1 - discount_min)
         
         if lower_bound <= price <= upper_bound:
-            return EvaluationResult(True, "HIGH", baseline, "Deal válido detectado", deal_hash)
+            return EvaluationResult(True, "HIGH", baseline, "Deal válido detectado", self._generate_hash(deal))
         
         return EvaluationResult(False, "HIGH", baseline, "Precio fuera de rango relativo", deal_hash)
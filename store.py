@@ -1,26 +1,167 @@
+import hashlib
+import os
 import sqlite3
 import logging
+import threading
+import time
+
 from datetime import datetime, timedelta
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, Optional, Iterable, List, Set
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+# Versión de la llave de deduplicación en notifications.hash_version:
+# 1 = md5 legacy, 2 = fingerprint de FlightOffer, 3 = fingerprint con alcance por watch (dedupe_key)
+DEDUPE_HASH_VERSION = 3
+
 class DealStore:
     """
     Maneja la persistencia de datos en SQLite.
     Responsable de guardar historial de precios y rastrear notificaciones previas.
+    Mantiene una conexión de larga duración por hilo (modo WAL) en lugar de abrir una por operación.
+    Puede usarse como context manager para cerrar las conexiones al terminar.
     """
 
+    # Pragmas aplicados a cada conexión nueva
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",     # Lectores concurrentes mientras hay un escritor
+        "PRAGMA synchronous=NORMAL",   # Seguro con WAL y evita un fsync por commit
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",     # ~8 MB de page cache
+        "PRAGMA busy_timeout=5000",
+    )
+
+    # Migraciones incrementales sobre el esquema base (versión 1).
+    # Cada entrada: (versión, descripción, sentencias). Se aplican en orden y una sola vez.
+    MIGRATIONS = [
+        (2, "Índice cubriente para baselines de price_history", [
+            '''CREATE INDEX IF NOT EXISTS idx_price_history_baseline
+               ON price_history (route, travel_month, recorded_at, price)''',
+            "ANALYZE",
+        ]),
+        (3, "Tabla materializada de baselines por ruta/mes", [
+            '''CREATE TABLE IF NOT EXISTS baseline_stats (
+                route TEXT NOT NULL,
+                travel_month TEXT NOT NULL,
+                window_days INTEGER NOT NULL,
+                median REAL,
+                sample_count INTEGER NOT NULL,
+                min_price REAL,
+                p25 REAL,
+                p75 REAL,
+                oldest_recorded_at DATETIME,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (route, travel_month, window_days)
+            )''',
+        ]),
+        (4, "Estado persistente de planificadores (cursores de sweep)", [
+            '''CREATE TABLE IF NOT EXISTS planner_state (
+                state_key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )''',
+        ]),
+        (5, "Outbox transaccional de notificaciones", [
+            '''CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                body TEXT NOT NULL,
+                digest_line TEXT,
+                context_tag TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                sent_at DATETIME
+            )''',
+            '''CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+               ON notification_outbox (status, next_attempt_at)''',
+        ]),
+        (6, "Agregados diarios/semanales de muestras fuera del horizonte de retención", [
+            '''CREATE TABLE IF NOT EXISTS price_history_rollup (
+                route TEXT NOT NULL,
+                travel_month TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                period_start TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                sample_count INTEGER NOT NULL,
+                min_price REAL NOT NULL,
+                max_price REAL NOT NULL,
+                sum_price REAL NOT NULL,
+                PRIMARY KEY (route, travel_month, granularity, period_start, currency)
+            )''',
+            '''CREATE INDEX IF NOT EXISTS idx_price_history_recorded_at
+               ON price_history (recorded_at)''',
+        ]),
+        (7, "Versión del hash de deduplicación en notifications", [
+            # Las filas existentes usan el md5 legacy (versión 1)
+            "ALTER TABLE notifications ADD COLUMN hash_version INTEGER NOT NULL DEFAULT 1",
+        ]),
+        # Sin cambio de esquema: desde DEDUPE_HASH_VERSION 3 las llaves de notifications llevan el
+        # watch. Las filas v1/v2 no lo tienen: se consultan como respaldo (legacy_hashes) y la
+        # compactación las borra al salir del horizonte de retención.
+    ]
+
+    # Inicio del periodo de agregación (SQLite): día o lunes de la semana
+    ROLLUP_PERIODS = {
+        "day": "date(recorded_at)",
+        "week": "date(recorded_at, '-6 days', 'weekday 1')",
+    }
+    MAINTENANCE_STATE_KEY = "maintenance:last_compaction"
+
+    # Estados del outbox: pending -> sending (lease) -> sent | pending (reintento) | failed
+    OUTBOX_ACTIVE = ("pending", "sending")
+
     def __init__(self, db_path: str = "deals.db"):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self._init_db()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """
+        Retorna la conexión del hilo actual, creándola la primera vez.
+        sqlite3 reutiliza las sentencias preparadas por conexión (cached_statements).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, cached_statements=128, check_same_thread=False)
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """
+        Cierra todas las conexiones abiertas por este store.
+        """
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+
     def _init_db(self):
         """
         Inicializa el esquema de la base de datos si no existe.
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_conn()
         cursor = conn.cursor()
 
         # Tabla de historial de precios para calcular baselines
@@ -47,77 +188,315 @@ class DealStore:
             )
         ''')
 
+        # Tabla de versión del esquema para migrar bases existentes in-place
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO schema_version (version) VALUES (1)')
+
         conn.commit()
-        conn.close()
+        self._migrate(conn)
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """
+        Aplica las migraciones pendientes según la versión registrada en schema_version.
+        """
+        current = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 1
+        for version, description, statements in self.MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Migrando base de datos a versión {version}: {description}")
+            try:
+                conn.execute("BEGIN")
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Error aplicando migración {version}: {e}")
+                raise
 
     def add_price_sample(self, route: str, travel_date: datetime, price: float, currency: str):
         """
         Guarda un muestreo de precio para futuras comparaciones (baseline).
         """
         travel_month = travel_date.strftime("%Y-%m")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._get_conn()
         
         try:
-            cursor.execute('''
+            conn.execute('''
                 INSERT INTO price_history (route, travel_month, price, currency)
                 VALUES (?, ?, ?, ?)
             ''', (route, travel_month, price, currency))
+            self._refresh_baselines_for(conn, [(route, travel_month)])
             conn.commit()
         except sqlite3.Error as e:
+            conn.rollback()
             logger.error(f"Error guardando precio: {e}")
-        finally:
-            conn.close()
+
+    def add_price_samples(self, samples: Iterable[Tuple[str, datetime, float, str]]) -> int:
+        """
+        Guarda muchas muestras (route, travel_date, price, currency) en una sola transacción.
+        Acepta cualquier iterable, incluido un generador: executemany lo consume en streaming.
+        Retorna el número de muestras insertadas.
+        """
+        inserted = 0
+        touched = set()
+
+        def rows():
+            nonlocal inserted
+            for route, travel_date, price, currency in samples:
+                inserted += 1
+                travel_month = travel_date.strftime("%Y-%m")
+                touched.add((route, travel_month))
+                yield (route, travel_month, price, currency)
+
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO price_history (route, travel_month, price, currency)
+                    VALUES (?, ?, ?, ?)
+                ''', rows())
+                self._refresh_baselines_for(conn, touched)
+        except sqlite3.Error as e:
+            logger.error(f"Error guardando lote de precios: {e}")
+            return 0
+        return inserted
 
     def get_baseline_stats(self, route: str, travel_date: datetime, days_back: int) -> Tuple[Optional[float], int]:
         """
-        Calcula la mediana (baseline) y cuenta las muestras en los últimos `days_back` días.
+        Retorna la mediana (baseline) y el número de muestras de los últimos `days_back` días.
+        Lee la fila materializada de baseline_stats; sólo recalcula si alguna muestra salió de la ventana.
         Retorna: (mediana, num_muestras)
         """
+        stats = self.get_baseline_details(route, travel_date, days_back)
+        return stats["median"], stats["count"]
+
+    def get_baseline_details(self, route: str, travel_date: datetime, days_back: int) -> Dict:
+        """
+        Estadísticas materializadas (median, count, min, p25, p75) para (ruta, mes de viaje).
+        """
         travel_month = travel_date.strftime("%Y-%m")
         # Fecha límite para considerar historial (window)
-        cutoff_date = (datetime.now() - timedelta(days=days_back)).strftime("%Y-%m-%d %H:%M:%S")
+        cutoff_date = self._cutoff(days_back)
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._get_conn()
+        row = conn.execute('''
+            SELECT median, sample_count, min_price, p25, p75, oldest_recorded_at
+            FROM baseline_stats
+            WHERE route = ? AND travel_month = ? AND window_days = ?
+        ''', (route, travel_month, days_back)).fetchone()
 
-        # Seleccionar precios para esa ruta y mes registrados recientemente
-        cursor.execute('''
-            SELECT price FROM price_history
+        # La fila sigue vigente mientras su muestra más antigua esté dentro de la ventana
+        if row is not None and (row[5] is None or row[5] >= cutoff_date):
+            return {"median": row[0], "count": row[1], "min": row[2], "p25": row[3], "p75": row[4]}
+
+        try:
+            with conn:
+                return self._refresh_baseline(conn, route, travel_month, days_back)
+        except sqlite3.Error as e:
+            logger.error(f"Error actualizando baseline materializado: {e}")
+            return {"median": None, "count": 0, "min": None, "p25": None, "p75": None}
+
+    def get_baseline_stats_many(self, keys: Iterable[Tuple[str, str]], days_back: int,
+                                materialize: bool = True) -> Dict[Tuple[str, str], Tuple[Optional[float], int]]:
+        """
+        Versión por lotes de get_baseline_stats para pares (ruta, mes 'YYYY-MM').
+        Lee todas las filas materializadas en una consulta; sólo recalcula las ausentes o vencidas.
+        Con materialize=False es de sólo lectura: las recalculadas no se guardan en baseline_stats
+        (p.ej. el planificador, que consulta celdas que quizá nunca se busquen).
+        Retorna: {(ruta, mes): (mediana, num_muestras)}
+        """
+        keys = list(dict.fromkeys(keys))
+        cutoff_date = self._cutoff(days_back)
+        conn = self._get_conn()
+        results = {}
+
+        # Lotes acotados para no exceder el límite de parámetros de SQLite
+        chunk_size = 400
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            placeholders = ",".join(["(?, ?)"] * len(chunk))
+            params = [days_back] + [value for key in chunk for value in key]
+            rows = conn.execute(f'''
+                SELECT route, travel_month, median, sample_count, oldest_recorded_at
+                FROM baseline_stats
+                WHERE window_days = ? AND (route, travel_month) IN (VALUES {placeholders})
+            ''', params).fetchall()
+            for route, travel_month, median, count, oldest in rows:
+                if oldest is None or oldest >= cutoff_date:
+                    results[(route, travel_month)] = (median, count)
+
+        missing = [key for key in keys if key not in results]
+        if missing and not materialize:
+            try:
+                for route, travel_month in missing:
+                    stats, _ = self._compute_baseline(conn, route, travel_month, days_back)
+                    results[(route, travel_month)] = (stats["median"], stats["count"])
+            except sqlite3.Error as e:
+                logger.error(f"Error calculando baselines: {e}")
+                for key in missing:
+                    results.setdefault(key, (None, 0))
+        elif missing:
+            try:
+                with conn:
+                    for route, travel_month in missing:
+                        stats = self._refresh_baseline(conn, route, travel_month, days_back)
+                        results[(route, travel_month)] = (stats["median"], stats["count"])
+            except sqlite3.Error as e:
+                logger.error(f"Error actualizando baselines materializados: {e}")
+                for key in missing:
+                    results.setdefault(key, (None, 0))
+        return results
+
+    def get_cell_stats(self, routes: Iterable[str], days_back: int) -> Dict[Tuple[str, str], Dict]:
+        """
+        Estadísticas agregadas por (ruta, mes) dentro de la ventana, usadas por el planificador adaptativo.
+        Retorna: {(ruta, mes): {"count", "mean", "variance", "min", "last_recorded_at"}}
+        """
+        routes = list(dict.fromkeys(routes))
+        if not routes:
+            return {}
+        placeholders = ",".join("?" * len(routes))
+        rows = self._get_conn().execute(f'''
+            SELECT route, travel_month, COUNT(*), AVG(price), AVG(price * price), MIN(price), MAX(recorded_at)
+            FROM price_history
+            WHERE route IN ({placeholders}) AND recorded_at >= ?
+            GROUP BY route, travel_month
+        ''', routes + [self._cutoff(days_back)]).fetchall()
+
+        stats = {}
+        for route, travel_month, count, mean, mean_sq, min_price, last_at in rows:
+            stats[(route, travel_month)] = {
+                "count": count,
+                "mean": mean,
+                "variance": max(0.0, mean_sq - mean * mean),
+                "min": min_price,
+                "last_recorded_at": last_at,
+            }
+        return stats
+
+    @staticmethod
+    def _cutoff(days_back: int) -> str:
+        return (datetime.now() - timedelta(days=days_back)).strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def _percentile(prices, q: float) -> float:
+        """Percentil con interpolación lineal sobre una lista ya ordenada."""
+        pos = (len(prices) - 1) * q
+        low = int(pos)
+        high = min(low + 1, len(prices) - 1)
+        return prices[low] + (prices[high] - prices[low]) * (pos - low)
+
+    def _refresh_baseline(self, conn: sqlite3.Connection, route: str, travel_month: str, days_back: int) -> Dict:
+        """
+        Recalcula y guarda la fila de baseline_stats para (ruta, mes, ventana).
+        Debe llamarse dentro de una transacción.
+        """
+        stats, oldest = self._compute_baseline(conn, route, travel_month, days_back)
+        conn.execute('''
+            INSERT INTO baseline_stats
+                (route, travel_month, window_days, median, sample_count, min_price, p25, p75, oldest_recorded_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(route, travel_month, window_days) DO UPDATE SET
+                median = excluded.median,
+                sample_count = excluded.sample_count,
+                min_price = excluded.min_price,
+                p25 = excluded.p25,
+                p75 = excluded.p75,
+                oldest_recorded_at = excluded.oldest_recorded_at,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (route, travel_month, days_back, stats["median"], stats["count"], stats["min"],
+              stats["p25"], stats["p75"], oldest))
+        return stats
+
+    def _compute_baseline(self, conn: sqlite3.Connection, route: str, travel_month: str,
+                          days_back: int) -> Tuple[Dict, Optional[str]]:
+        """
+        Calcula las estadísticas de baseline de (ruta, mes) sin escribir nada.
+        Retorna: (estadísticas, recorded_at de la muestra más vieja)
+        """
+        cutoff_date = self._cutoff(days_back)
+
+        # Seleccionar precios para esa ruta y mes registrados recientemente (índice cubriente)
+        rows = conn.execute('''
+            SELECT price, recorded_at FROM price_history
             WHERE route = ? 
             AND travel_month = ?
             AND recorded_at >= ?
             ORDER BY price
-        ''', (route, travel_month, cutoff_date))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        ''', (route, travel_month, cutoff_date)).fetchall()
 
-        if not rows:
-            return None, 0
+        stats = {"median": None, "count": 0, "min": None, "p25": None, "p75": None}
+        oldest = None
+        if rows:
+            prices = [r[0] for r in rows]
+            count = len(prices)
+            oldest = min(r[1] for r in rows)
 
-        prices = [r[0] for r in rows]
-        count = len(prices)
-        
-        # Cálculo de mediana simple
-        if count % 2 == 1:
-            median = prices[count // 2]
-        else:
-            mid = count // 2
-            median = (prices[mid - 1] + prices[mid]) / 2.0
-            
-        return median, count
+            # Cálculo de mediana simple
+            if count % 2 == 1:
+                median = prices[count // 2]
+            else:
+                mid = count // 2
+                median = (prices[mid - 1] + prices[mid]) / 2.0
+
+            stats = {
+                "median": median,
+                "count": count,
+                "min": prices[0],
+                "p25": self._percentile(prices, 0.25),
+                "p75": self._percentile(prices, 0.75),
+            }
+        return stats, oldest
+
+    def _refresh_baselines_for(self, conn: sqlite3.Connection, keys: Iterable[Tuple[str, str]]):
+        """
+        Mantenimiento incremental tras una ingesta: recalcula sólo las filas materializadas
+        de los pares (ruta, mes) que recibieron muestras nuevas.
+        """
+        for route, travel_month in keys:
+            windows = conn.execute('''
+                SELECT window_days FROM baseline_stats WHERE route = ? AND travel_month = ?
+            ''', (route, travel_month)).fetchall()
+            for (window_days,) in windows:
+                self._refresh_baseline(conn, route, travel_month, window_days)
+
+    def get_state(self, key: str) -> Optional[str]:
+        """
+        Lee un valor de estado persistente (p.ej. el cursor del planificador de fechas).
+        """
+        row = self._get_conn().execute('SELECT value FROM planner_state WHERE state_key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        conn = self._get_conn()
+        try:
+            conn.execute('''
+                INSERT INTO planner_state (state_key, value, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(state_key) DO UPDATE SET
+                    value = excluded.value,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (key, value))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Error guardando estado '{key}': {e}")
 
     def get_last_notification(self, deal_hash: str) -> Optional[Dict]:
         """
         Obtiene información de la última notificación para este deal específico.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._get_conn().cursor()
         
         cursor.execute('SELECT last_price, last_notified_at FROM notifications WHERE deal_hash = ?', (deal_hash,))
         row = cursor.fetchone()
-        conn.close()
 
         if row:
             return {
@@ -126,23 +505,305 @@ class DealStore:
             }
         return None
 
+    @staticmethod
+    def dedupe_key(scope: str, deal_hash: str) -> str:
+        """
+        Llave de deduplicación de un deal dentro de un watch: el mismo itinerario visto por dos
+        watches se notifica (y se deduplica) por separado.
+        """
+        return hashlib.blake2b(f"{scope}|{deal_hash}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def get_last_notifications(self, deal_hashes: Iterable[str],
+                               legacy_hashes: Optional[Dict[int, Dict[str, str]]] = None) -> Dict[str, Dict]:
+        """
+        Versión por lotes de get_last_notification: una consulta para todos los hashes candidatos.
+        `legacy_hashes` ({versión: {llave actual: llave de esa versión}}) permite encontrar
+        notificaciones registradas con una llave anterior; el resultado siempre se indexa por la
+        llave actual y, si hay varias, gana la versión más reciente.
+        Retorna: {deal_hash: {"last_price", "last_notified_at"}} sólo para los ya notificados.
+        """
+        index = self._select_notifications(list(dict.fromkeys(deal_hashes)))
+
+        for version in sorted(legacy_hashes or {}, reverse=True):
+            missing = {legacy: current for current, legacy in legacy_hashes[version].items()
+                       if current not in index}
+            for legacy, row in self._select_notifications(list(missing), hash_version=version).items():
+                index[missing[legacy]] = row
+        return index
+
+    def _select_notifications(self, deal_hashes: List[str], hash_version: Optional[int] = None) -> Dict[str, Dict]:
+        conn = self._get_conn()
+        index = {}
+        version_filter = "" if hash_version is None else f" AND hash_version = {int(hash_version)}"
+        chunk_size = 500
+        for start in range(0, len(deal_hashes), chunk_size):
+            chunk = deal_hashes[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f'''
+                SELECT deal_hash, last_price, last_notified_at FROM notifications
+                WHERE deal_hash IN ({placeholders}){version_filter}
+            ''', chunk).fetchall()
+            for deal_hash, last_price, last_notified_at in rows:
+                index[deal_hash] = {"last_price": last_price, "last_notified_at": last_notified_at}
+        return index
+
+    def legacy_hash_versions(self) -> Set[int]:
+        """Versiones anteriores a DEDUPE_HASH_VERSION que aún tienen notificaciones registradas."""
+        rows = self._get_conn().execute('SELECT DISTINCT hash_version FROM notifications WHERE hash_version < ?',
+                                        (DEDUPE_HASH_VERSION,)).fetchall()
+        return {row[0] for row in rows}
+
     def record_notification(self, deal_hash: str, price: float):
         """
         Registra (o actualiza) que se envió una notificación para prevenir spam.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._get_conn()
         
         try:
-            cursor.execute('''
-                INSERT INTO notifications (deal_hash, last_price, last_notified_at)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
+            conn.execute('''
+                INSERT INTO notifications (deal_hash, last_price, last_notified_at, hash_version)
+                VALUES (?, ?, CURRENT_TIMESTAMP, ?)
                 ON CONFLICT(deal_hash) DO UPDATE SET
                     last_price = excluded.last_price,
-                    last_notified_at = CURRENT_TIMESTAMP
-            ''', (deal_hash, price))
+                    last_notified_at = CURRENT_TIMESTAMP,
+                    hash_version = excluded.hash_version
+            ''', (deal_hash, price, DEDUPE_HASH_VERSION))
             conn.commit()
         except sqlite3.Error as e:
+            conn.rollback()
             logger.error(f"Error registrando notificación: {e}")
-        finally:
-            conn.close()
+
+    def enqueue_notification(self, idempotency_key: str, kind: str, recipient: str, body: str,
+                             digest_line: Optional[str] = None, context_tag: Optional[str] = None,
+                             deal_hash: Optional[str] = None, price: Optional[float] = None) -> bool:
+        """
+        Escribe el mensaje en el outbox y, si es una alerta, el registro de deduplicación,
+        en una sola transacción: o quedan ambos o ninguno.
+        Retorna False si la llave de idempotencia ya existía (mensaje ya encolado).
+        """
+        return self.enqueue_notifications([{
+            "idempotency_key": idempotency_key, "kind": kind, "recipient": recipient, "body": body,
+            "digest_line": digest_line, "context_tag": context_tag, "deal_hash": deal_hash, "price": price
+        }]) > 0
+
+    def enqueue_notifications(self, entries: Iterable[Dict]) -> int:
+        """
+        Versión por lotes de enqueue_notification: todo el outbox de la ejecución y el upsert de
+        deduplicación en una sola transacción. Retorna cuántos mensajes nuevos se encolaron.
+        Sólo se registra la deduplicación de los mensajes que realmente entraron al outbox:
+        si la llave de idempotencia ya existía, el registro previo queda intacto.
+        """
+        entries = list(entries)
+        if not entries:
+            return 0
+        now = time.time()
+        conn = self._get_conn()
+        try:
+            with conn:
+                inserted = []
+                for e in entries:
+                    cursor = conn.execute('''
+                        INSERT OR IGNORE INTO notification_outbox
+                            (idempotency_key, kind, recipient, body, digest_line, context_tag, next_attempt_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (e["idempotency_key"], e["kind"], e["recipient"], e["body"], e.get("digest_line"),
+                          e.get("context_tag"), now))
+                    if cursor.rowcount == 1:
+                        inserted.append(e)
+                queued = len(inserted)
+                conn.executemany('''
+                    INSERT INTO notifications (deal_hash, last_price, last_notified_at, hash_version)
+                    VALUES (?, ?, CURRENT_TIMESTAMP, ?)
+                    ON CONFLICT(deal_hash) DO UPDATE SET
+                        last_price = excluded.last_price,
+                        last_notified_at = CURRENT_TIMESTAMP,
+                        hash_version = excluded.hash_version
+                ''', [(e["deal_hash"], e["price"], DEDUPE_HASH_VERSION)
+                      for e in inserted if e.get("deal_hash") is not None])
+            return queued
+        except sqlite3.Error as e:
+            logger.error(f"Error encolando notificaciones: {e}")
+            return 0
+
+    def claim_notifications(self, limit: int = 100, lease_seconds: float = 300) -> List[Dict]:
+        """
+        Toma los mensajes listos para enviar y los marca 'sending' con un lease.
+        Un 'sending' cuyo lease venció (proceso caído a mitad del envío) vuelve a ser elegible.
+        """
+        now = time.time()
+        conn = self._get_conn()
+        try:
+            with conn:
+                rows = conn.execute('''
+                    SELECT id, idempotency_key, kind, recipient, body, digest_line, context_tag, attempts
+                    FROM notification_outbox
+                    WHERE status IN (?, ?) AND next_attempt_at <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', self.OUTBOX_ACTIVE + (now, limit)).fetchall()
+                conn.executemany('''
+                    UPDATE notification_outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?
+                ''', [(now + lease_seconds, row[0]) for row in rows])
+        except sqlite3.Error as e:
+            logger.error(f"Error leyendo outbox de notificaciones: {e}")
+            return []
+
+        keys = ("id", "idempotency_key", "kind", "recipient", "body", "digest_line", "context_tag", "attempts")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def mark_notifications_sent(self, ids: Iterable[int]):
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.executemany('''
+                    UPDATE notification_outbox
+                    SET status = 'sent', sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1, last_error = NULL
+                    WHERE id = ?
+                ''', [(i,) for i in ids])
+        except sqlite3.Error as e:
+            logger.error(f"Error marcando notificaciones enviadas: {e}")
+
+    def release_notifications(self, ids: Iterable[int]):
+        """Devuelve a 'pending' mensajes tomados que no se llegaron a enviar (sin contar el intento)."""
+        ids = list(ids)
+        if not ids:
+            return
+        now = time.time()
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.executemany('''
+                    UPDATE notification_outbox SET status = 'pending', next_attempt_at = ?
+                    WHERE id = ? AND status = 'sending'
+                ''', [(now, i) for i in ids])
+        except sqlite3.Error as e:
+            logger.error(f"Error liberando notificaciones: {e}")
+
+    def mark_notifications_failed(self, ids: Iterable[int], error: str, retry_in: Optional[float] = None,
+                                  max_attempts: int = 1):
+        """
+        Registra un intento fallido: vuelve a 'pending' tras `retry_in` segundos o queda 'failed'
+        si no hay reintento o se alcanzó `max_attempts`.
+        """
+        next_attempt = time.time() + (retry_in or 0)
+        retry = 1 if retry_in is not None else 0
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.executemany('''
+                    UPDATE notification_outbox
+                    SET attempts = attempts + 1,
+                        last_error = ?,
+                        next_attempt_at = ?,
+                        status = CASE WHEN ? = 1 AND attempts + 1 < ? THEN 'pending' ELSE 'failed' END
+                    WHERE id = ?
+                ''', [(error[:500], next_attempt, retry, max_attempts, i) for i in ids])
+        except sqlite3.Error as e:
+            logger.error(f"Error registrando fallo de notificaciones: {e}")
+
+    def count_pending_notifications(self) -> int:
+        row = self._get_conn().execute('''
+            SELECT COUNT(*) FROM notification_outbox WHERE status IN (?, ?)
+        ''', self.OUTBOX_ACTIVE).fetchone()
+        return row[0]
+
+    def next_notification_due(self) -> Optional[float]:
+        """Momento (epoch) del próximo mensaje pendiente, o None si el outbox está vacío."""
+        row = self._get_conn().execute('''
+            SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status IN (?, ?)
+        ''', self.OUTBOX_ACTIVE).fetchone()
+        return row[0]
+
+    def compact(self, raw_days: Optional[int], granularity: str = "week", vacuum: bool = True) -> Dict:
+        """
+        Retención de price_history: las muestras más viejas que `raw_days` se resumen en
+        price_history_rollup (conteo, min, max y suma por ruta/mes/periodo) y se borran.
+        El horizonte nunca es menor que la ventana más grande usada por baseline_stats,
+        así los baselines no cambian. Después corre ANALYZE y, opcionalmente, VACUUM.
+        Con `raw_days` vacío o 0 (retención deshabilitada) sólo corren ANALYZE y VACUUM.
+        Retorna un resumen de lo compactado.
+        """
+        if granularity not in self.ROLLUP_PERIODS:
+            raise ValueError(f"Granularidad inválida: {granularity} (use 'day' o 'week')")
+
+        conn = self._get_conn()
+        size_before = self._db_size()
+        deleted = rolled_up = outbox_deleted = 0
+        if raw_days:
+            max_window = conn.execute('SELECT MAX(window_days) FROM baseline_stats').fetchone()[0] or 0
+            raw_days = max(int(raw_days), max_window)
+            cutoff_date = self._cutoff(raw_days)
+
+            period = self.ROLLUP_PERIODS[granularity]
+            try:
+                with conn:
+                    before = conn.total_changes
+                    conn.execute(f'''
+                        INSERT INTO price_history_rollup
+                            (route, travel_month, granularity, period_start, currency,
+                             sample_count, min_price, max_price, sum_price)
+                        SELECT route, travel_month, ?, {period}, currency,
+                               COUNT(*), MIN(price), MAX(price), SUM(price)
+                        FROM price_history
+                        WHERE recorded_at < ?
+                        GROUP BY route, travel_month, {period}, currency
+                        ON CONFLICT(route, travel_month, granularity, period_start, currency) DO UPDATE SET
+                            sample_count = sample_count + excluded.sample_count,
+                            min_price = MIN(min_price, excluded.min_price),
+                            max_price = MAX(max_price, excluded.max_price),
+                            sum_price = sum_price + excluded.sum_price
+                    ''', (granularity, cutoff_date))
+                    rolled_up = conn.total_changes - before
+                    deleted = conn.execute('DELETE FROM price_history WHERE recorded_at < ?', (cutoff_date,)).rowcount
+                    # Mensajes ya resueltos del outbox con la misma retención
+                    outbox_deleted = conn.execute('''
+                        DELETE FROM notification_outbox WHERE status IN ('sent', 'failed') AND created_at < ?
+                    ''', (cutoff_date,)).rowcount
+                    # Registros de dedupe con llaves anteriores (sin watch) que ya no se renuevan
+                    conn.execute('DELETE FROM notifications WHERE hash_version < ? AND last_notified_at < ?',
+                                 (DEDUPE_HASH_VERSION, cutoff_date))
+            except sqlite3.Error as e:
+                logger.error(f"Error compactando price_history: {e}")
+                raise
+
+        conn.execute("ANALYZE")
+        conn.commit()
+        if vacuum:
+            # VACUUM no puede correr dentro de una transacción; el checkpoint vacía el WAL
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        self.set_state(self.MAINTENANCE_STATE_KEY, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        summary = {
+            "raw_days": raw_days or None,
+            "samples_deleted": deleted,
+            "rollup_rows": rolled_up,
+            "outbox_deleted": outbox_deleted,
+            "bytes_before": size_before,
+            "bytes_after": self._db_size(),
+        }
+        logger.info(f"Compactación: {deleted} muestras resumidas en {rolled_up} filas ({granularity}), "
+                    f"{outbox_deleted} mensajes viejos borrados; {size_before} -> {summary['bytes_after']} bytes.")
+        return summary
+
+    def compact_if_due(self, raw_days: int, granularity: str = "week", interval_days: float = 7) -> Optional[Dict]:
+        """
+        Corre compact() si pasaron `interval_days` desde la última compactación (registrada en planner_state).
+        """
+        last = self.get_state(self.MAINTENANCE_STATE_KEY)
+        if last:
+            try:
+                if datetime.now() - datetime.strptime(last, "%Y-%m-%d %H:%M:%S") < timedelta(days=interval_days):
+                    return None
+            except ValueError:
+                pass
+        return self.compact(raw_days, granularity)
+
+    def _db_size(self) -> int:
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.db_path + suffix)
+            except OSError:
+                pass
+        return size
@@ -0,0 +1,56 @@
+import os
+import stat
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import bench_search
+from amadeus_client import AmadeusClient
+
+
+class FailingTokenHandler(bench_search.StubAmadeusHandler):
+    """Stub de Amadeus cuyo endpoint de token responde 401."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._send_json({"error": "invalid_client"}, status=401)
+
+
+@pytest.fixture
+def failing_token_host(monkeypatch):
+    monkeypatch.setattr(bench_search, "LATENCY_SECONDS", 0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FailingTokenHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_failing_token_returns_no_offers(failing_token_host, workers):
+    config = bench_search.build_config(num_queries=6, workers=workers, rps=1000)
+    client = AmadeusClient("id", "secret", config)
+    client.HOST = failing_token_host
+
+    # Secuencial y concurrente se comportan igual: cada consulta falla y se registra, sin excepción
+    assert client.search_flights("MEX", ["NRT", "HND"]) == []
+
+
+def test_token_cache_defaults_to_private_user_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = bench_search.build_config(num_queries=1, workers=1, rps=1000)
+    del config["system"]["token_cache_path"]
+    client = AmadeusClient("id", "secret", config)
+    client.token, client.token_expiry = "abc", time.time() + 600
+
+    client._save_cached_token()
+
+    path = tmp_path / "cache" / "flight_monitor" / "amadeus_token.json"
+    assert client.token_cache_path == str(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
+    assert AmadeusClient("id", "secret", config)._load_cached_token()
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from json_stream import iter_json_array
+
+DOCUMENT = {
+    "meta": {"count": 3, "links": {"self": "https://x/?a=1&b=[2]"}},
+    "data": [
+        1e10, -0.5, 123456789, 0, -12.75e-3, 3E+2,
+        "texto con \"comillas\", comas y ] corchetes", "ñandú ✈️ \\u00e9 é", "",
+        {"price": {"total": "123.45"}, "itineraries": [{"segments": [{"at": "2026-12-01T10:00:00"}]}]},
+        [1, [2, [3, {"a": None, "b": True, "c": False}]]],
+        True, False, None,
+    ],
+    "dictionaries": {"carriers": {"AM": "AEROMEXICO"}},
+}
+TEXT = json.dumps(DOCUMENT, ensure_ascii=False)
+RAW = TEXT.encode("utf-8")
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", range(1, len(RAW) + 1))
+def test_every_chunk_size_bytes(size):
+    assert list(iter_json_array(_chunks(RAW, size), "data")) == DOCUMENT["data"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, len(TEXT)])
+def test_chunked_str(size):
+    assert list(iter_json_array(_chunks(TEXT, size), "data")) == DOCUMENT["data"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7])
+def test_numbers_split_at_exponent_and_sign(size):
+    doc = b'{"data": [1e10, -0.5, 123456789]}'
+    assert list(iter_json_array(_chunks(doc, size), "data")) == [1e10, -0.5, 123456789]
+
+
+def test_missing_and_empty_array():
+    assert list(iter_json_array([b'{"meta": {}}'], "data")) == []
+    assert list(iter_json_array([b'{"data": []}'], "data")) == []
+    assert list(iter_json_array([b"{}"], "data")) == []
+
+
+def test_invalid_json_raises():
+    with pytest.raises(ValueError):
+        list(iter_json_array(_chunks(b'{"data": [1 2]}', 3), "data"))
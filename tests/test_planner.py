@@ -0,0 +1,28 @@
+import random
+from datetime import datetime, timedelta
+
+import bench_search
+import store as store_module
+from planner import AdaptiveQueryPlanner
+
+
+def _baseline_rows(store):
+    return store._get_conn().execute("SELECT * FROM baseline_stats ORDER BY route, travel_month").fetchall()
+
+
+def test_plan_does_not_materialize_baselines(tmp_path):
+    config = bench_search.build_config(num_queries=8, workers=1, rps=1000)
+    config["system"]["query_planner"] = "adaptive"
+    config["scoring"] = {"baseline_days": 60, "min_samples": 3}
+    today = datetime(2026, 1, 1)
+
+    with store_module.DealStore(str(tmp_path / "deals.db")) as store:
+        travel = today + timedelta(days=45)
+        store.add_price_samples([("MEX-NRT", travel, price, "MXN") for price in (21000, 23000, 25000)])
+        before = _baseline_rows(store)
+
+        planner = AdaptiveQueryPlanner(config, store, today=today, rng=random.Random(7))
+        queries = planner.plan("MEX", ["NRT", "HND"], 8)
+
+        assert len(queries) == 8
+        assert _baseline_rows(store) == before
@@ -0,0 +1,29 @@
+import sqlite3
+
+from response_cache import ResponseCache
+
+
+def test_hit_within_touch_interval_skips_write(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    cache.set("k", {"data": [1]})
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    assert cache.get("k") == {"data": [1]}
+    assert not any(s.lstrip().upper().startswith("UPDATE") for s in statements)
+    assert cache.stats() == {"hits": 1, "misses": 0}
+    cache.close()
+
+
+def test_corrupt_payload_is_a_miss_and_is_deleted(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path)
+    cache.set("k", {"data": [1]})
+    cache._conn.execute("UPDATE response_cache SET payload = '{\"data\": [' WHERE cache_key = 'k'")
+    cache._conn.commit()
+
+    assert cache.get("k") is None
+    assert cache.stats() == {"hits": 0, "misses": 1}
+    cache.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] == 0
@@ -0,0 +1,28 @@
+import store as store_module
+
+
+def _alert(key, price, deal_hash="watch-deal"):
+    return {
+        "idempotency_key": key,
+        "kind": "alert",
+        "recipient": "+5210000000000",
+        "body": f"Oferta {price}",
+        "digest_line": f"Oferta {price}",
+        "context_tag": "NRT",
+        "deal_hash": deal_hash,
+        "price": price,
+    }
+
+
+def test_enqueue_notifications_skips_dedupe_for_ignored_rows(tmp_path):
+    with store_module.DealStore(str(tmp_path / "deals.db")) as store:
+        assert store.enqueue_notifications([_alert("alert:a:500.00", 500.0)]) == 1
+
+        # Misma llave de idempotencia con otro precio: el outbox la ignora y el registro no cambia
+        assert store.enqueue_notifications([_alert("alert:a:500.00", 450.0)]) == 0
+        last = store.get_last_notifications(["watch-deal"], {})
+        assert last["watch-deal"]["last_price"] == 500.0
+
+        assert store.enqueue_notifications([_alert("alert:a:450.00", 450.0)]) == 1
+        last = store.get_last_notifications(["watch-deal"], {})
+        assert last["watch-deal"]["last_price"] == 450.0
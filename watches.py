@@ -0,0 +1,94 @@
+import copy
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Secciones de la config que cada watch puede sobrescribir (merge superficial por sección)
+OVERRIDABLE_SECTIONS = ("dates", "filters", "budget", "scoring")
+# Llaves de `system` que tiene sentido cambiar por watch; el resto (rate limit, hilos,
+# cache) es global del proceso
+OVERRIDABLE_SYSTEM_KEYS = ("recipient_phone", "max_queries_per_run", "query_planner",
+                           "use_calendar_prefilter", "calendar_top_k", "max_offers_per_query",
+                           "send_summary_if_no_deals")
+
+
+@dataclass
+class Watch:
+    """
+    Un par origen/destino monitoreado, con su config efectiva (global + overrides).
+    """
+    name: str
+    origin: str
+    destination: str
+    destination_airports_limit: int
+    config: Dict[str, Any]
+    # Intervalo o cron del modo daemon (por defecto `system.schedule`)
+    schedule: Optional[str] = None
+
+
+def _merge_watch_config(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    config = copy.deepcopy(base)
+    for section in OVERRIDABLE_SECTIONS:
+        if section in overrides:
+            config.setdefault(section, {}).update(overrides[section])
+    for key in OVERRIDABLE_SYSTEM_KEYS:
+        if key in overrides:
+            config["system"][key] = overrides[key]
+    return config
+
+
+def load_watches(config: Dict[str, Any]) -> List[Watch]:
+    """
+    Expande la sección `watches` de la config en una lista de Watch.
+    Sin `watches` se usa la sección `travel` como un único watch (compatibilidad).
+
+    Ejemplo:
+        watches:
+          - origin: MX
+            destination: JP
+          - name: gdl-europa
+            origin: GDL
+            destination: ES
+            destination_airports_limit: 3
+            budget: {max_price: 30000}
+            recipient_phone: "+52..."
+            schedule: "0 */6 * * *"
+    """
+    travel = config.get("travel", {})
+    default_limit = travel.get("destination_airports_limit", 4)
+
+    entries = config.get("watches")
+    if not entries:
+        entries = [{
+            "origin": travel["origin_country"],
+            "destination": travel["destination_country"],
+            "destination_airports_limit": default_limit
+        }]
+
+    watches = []
+    seen_names = set()
+    for entry in entries:
+        try:
+            origin = str(entry["origin"]).upper()
+            destination = str(entry["destination"]).upper()
+        except KeyError as e:
+            logger.error(f"Watch inválido (falta {e}): {entry}")
+            continue
+
+        name = entry.get("name") or f"{origin}-{destination}"
+        if name in seen_names:
+            logger.warning(f"Watch duplicado '{name}' ignorado.")
+            continue
+        seen_names.add(name)
+
+        watches.append(Watch(
+            name=name,
+            origin=origin,
+            destination=destination,
+            destination_airports_limit=int(entry.get("destination_airports_limit", default_limit)),
+            config=_merge_watch_config(config, entry),
+            schedule=entry.get("schedule", config.get("system", {}).get("schedule"))
+        ))
+    return watches